@@ -1,24 +1,74 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.contrib.auth.models import User
 
-from .models import Post, Group, Comment, Follow
+from . import purge, search
+from .models import Post, Group, Comment, Follow, FeedEntry, Profile, \
+    ArchivedPost, ArchivedComment
 
 
-class PostAdmin(admin.ModelAdmin):
-    list_display = ("pk", "text", "pub_date", "author", "group")
+class SoftDeleteAdminMixin:
+    """Удаление только помечает объекты, остальное делает purge.
+
+    Связанные объекты не собираются: страница подтверждения и само
+    удаление большой группы или автора не ждут каскада.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        return (
+            [str(obj) for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model._default_manager.filter(
+            pk=obj.pk
+        ))
+
+    def delete_queryset(self, request, queryset):
+        purge.delete(queryset)
+
+
+class FullTextSearchMixin:
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        ids = search.search(
+            self.search_kind, search_term, limit=settings.SEARCH_MAX_RESULTS
+        )
+        return queryset.filter(pk__in=ids), False
+
+
+class PostAdmin(SoftDeleteAdminMixin, FullTextSearchMixin,
+                admin.ModelAdmin):
+    search_kind = "posts"
+    list_display = (
+        "pk", "text", "pub_date", "author", "group", "comment_count"
+    )
     search_fields = ("text",)
     list_filter = ("pub_date",)
     list_editable = ("group",)
     empty_value_display = "-пусто-"
 
 
-class GroupAdmin(admin.ModelAdmin):
-    list_display = ("pk", "title", "slug", "description")
+class GroupAdmin(SoftDeleteAdminMixin, admin.ModelAdmin):
+    list_display = ("pk", "title", "slug", "description", "post_count")
     search_fields = ("description",)
     list_filter = ("title",)
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(SoftDeleteAdminMixin, FullTextSearchMixin,
+                   admin.ModelAdmin):
+    search_kind = "comments"
     list_display = ("pk", "text", "post", "created", "author")
     search_fields = ("text",)
     list_filter = ("created",)
@@ -30,8 +80,65 @@ class FollowAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
+class ProfileAdmin(SoftDeleteAdminMixin, admin.ModelAdmin):
+    list_display = ("user", "follower_count", "following_count")
+    search_fields = ("user__username",)
+    empty_value_display = "-пусто-"
+
+    def delete_queryset(self, request, queryset):
+        purge.delete_users(User.objects.filter(profile__in=queryset))
+
+
+class UserAdmin(SoftDeleteAdminMixin, BaseUserAdmin):
+    def delete_queryset(self, request, queryset):
+        purge.delete_users(queryset)
+
+
+class ArchiveAdminMixin:
+    # Архив пополняет только archive.run, удаляет только purge.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedPostAdmin(ArchiveAdminMixin, FullTextSearchMixin,
+                        admin.ModelAdmin):
+    search_kind = "archived_posts"
+    list_display = (
+        "pk", "text", "pub_date", "author", "group", "comment_count"
+    )
+    search_fields = ("text",)
+    list_filter = ("pub_date",)
+    empty_value_display = "-пусто-"
+
+
+class ArchivedCommentAdmin(ArchiveAdminMixin, FullTextSearchMixin,
+                           admin.ModelAdmin):
+    search_kind = "archived_comments"
+    list_display = ("pk", "text", "post", "created", "author")
+    search_fields = ("text",)
+    list_filter = ("created",)
+    empty_value_display = "-пусто-"
+
+
+class FeedEntryAdmin(admin.ModelAdmin):
+    list_display = ("pk", "user", "post", "pub_date")
+    raw_id_fields = ("user", "post")
+    empty_value_display = "-пусто-"
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
-
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(FeedEntry, FeedEntryAdmin)
+admin.site.register(ArchivedPost, ArchivedPostAdmin)
+admin.site.register(ArchivedComment, ArchivedCommentAdmin)
+admin.site.unregister(User)
+admin.site.register(User, UserAdmin)
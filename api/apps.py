@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import cache, metrics, search, signals  # noqa: F401
+
+        checks.register(
+            cache.check_shared_cache, checks.Tags.caches, deploy=True
+        )
+
+        post_migrate.connect(search.install, sender=self)
@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, recent
+from .models import ArchivedComment, ArchivedPost, Comment, FeedEntry, \
+    Group, Post, Profile
+from .scheduler import Worker
+
+
+def cutoff(days=None):
+    if days is None:
+        days = settings.ARCHIVE['DAYS']
+    return timezone.now() - timedelta(days=days)
+
+
+# (версия тега archive, есть ли посты в архиве): пока архив пуст,
+# списки не тратят на него запрос.
+_known = None
+
+
+def has_posts():
+    global _known
+    version = cache.versions(['archive'])[0]
+    known = _known
+    if known is None or known[0] != version:
+        known = _known = (version, ArchivedPost.objects.exists())
+    return known[1]
+
+
+def _copy(model, instance):
+    return model(**{
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+    })
+
+
+def _raw_delete(queryset):
+    return queryset._raw_delete(queryset.db)
+
+
+def run(limit, days=None):
+    """Переносит в архив до limit старых постов с их комментариями."""
+    with transaction.atomic():
+        # Посты удалённых групп и авторов сначала пометит purge.
+        posts = list(Post.objects.filter(pub_date__lt=cutoff(days)).exclude(
+            group__in=Group.all_objects.filter(
+                deleted_at__isnull=False
+            ).values('pk')
+        ).exclude(
+            author__in=Profile.all_objects.filter(
+                deleted_at__isnull=False
+            ).values('user')
+        ).order_by('pub_date')[:limit])
+        if not posts:
+            return 0
+        ids = [post.pk for post in posts]
+        ArchivedPost.objects.bulk_create(
+            [_copy(ArchivedPost, post) for post in posts], batch_size=500
+        )
+        ArchivedComment.objects.bulk_create(
+            [_copy(ArchivedComment, comment)
+             for comment in Comment.objects.filter(post__in=ids)],
+            batch_size=500,
+        )
+        # Содержимое не меняется, поэтому сигналов и записей в журнале нет:
+        # строки удаляются как в purge, помеченные комментарии — вместе
+        # с остальными. Лента держит только свежие посты.
+        _raw_delete(FeedEntry.objects.filter(post__in=ids))
+        _raw_delete(Comment.all_objects.filter(post__in=ids))
+        _raw_delete(Post.all_objects.filter(pk__in=ids))
+        recent.invalidate(*{
+            post.group_id for post in posts if post.group_id is not None
+        })
+        cache.bump_on_commit('posts', 'comments', 'archive')
+    return len(posts)
+
+
+worker = Worker('archive', run, 'ARCHIVE')
+
+
+def schedule():
+    if settings.ARCHIVE['BACKGROUND']:
+        worker.wake_periodically()
+
+
+class Tiered:
+    """Горячая таблица и архив как один упорядоченный по дате список.
+
+    Все строки архива старше горячих, поэтому при обходе от новых к старым
+    архив читается, только если горячих строк на страницу не хватило.
+    Поддерживает то, что нужно CursorPagination: order_by, filter и срез.
+    """
+
+    def __init__(self, hot, archived, descending=True):
+        self.hot = hot
+        self.archived = archived
+        self.descending = descending
+
+    def order_by(self, *fields):
+        return Tiered(
+            self.hot.order_by(*fields),
+            self.archived.order_by(*fields),
+            fields[0].startswith('-'),
+        )
+
+    def filter(self, *args, **kwargs):
+        return Tiered(
+            self.hot.filter(*args, **kwargs),
+            self.archived.filter(*args, **kwargs),
+            self.descending,
+        )
+
+    def __getitem__(self, key):
+        start, stop = key.start or 0, key.stop
+        first, second = self.hot, self.archived
+        if not self.descending:
+            first, second = second, first
+        results = list(first[start:stop])
+        if len(results) < stop - start:
+            skip = 0
+            if start and not results:
+                skip = max(start - first.count(), 0)
+            results += second[skip:skip + stop - start - len(results)]
+        return results
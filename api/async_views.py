@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework.exceptions import NotFound, Throttled
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Post, Comment, Group, ArchivedPost, ArchivedComment
+from .pagination import AsyncKeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import PostSerializer, CommentSerializer, GroupSerializer
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        FastJSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+    )
+
+
+def safe_only(view):
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        try:
+            return await view(request, *args, **kwargs)
+        except NotFound as error:
+            return json_response({'detail': str(error.detail)}, status=404)
+        except Throttled as error:
+            response = json_response(
+                {'detail': str(error.detail)}, status=429
+            )
+            if error.wait is not None:
+                response['Retry-After'] = str(error.wait)
+            return response
+    return wrapper
+
+
+def _check_throttles(request, scope):
+    # Без аутентификаторов запрос анонимный: эти представления только
+    # читают и JWT не проверяют, лимиты считаются по IP.
+    drf_request = Request(request, authenticators=())
+    view = SimpleNamespace(throttle_scope=scope)
+    waits = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(drf_request, view):
+            waits.append(throttle.wait())
+    if waits:
+        raise Throttled(max(
+            (wait for wait in waits if wait is not None), default=None
+        ))
+
+
+def throttled(scope=None):
+    """Те же ограничения, что у представлений DRF с throttle_scope."""
+    def decorator(view):
+        async def wrapper(request, *args, **kwargs):
+            await sync_to_async(_check_throttles)(request, scope)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _page(request, results, next_link):
+    return json_response(
+        {'next': next_link, 'previous': None, 'results': results}
+    )
+
+
+@safe_only
+@throttled('posts')
+async def post_list(request):
+    queryset = Post.objects.visible().select_related('author')
+    archived = ArchivedPost.objects.visible().select_related('author')
+    group = request.GET.get('group')
+    if group:
+        if not group.isdigit():
+            return json_response(
+                {'group': ['Ожидается ID группы.']}, status=400
+            )
+        queryset = queryset.filter(group=group)
+        archived = archived.filter(group=group)
+    posts, next_link = await AsyncKeysetPagination('-pub_date').paginate(
+        queryset, request, archived
+    )
+    serializer = PostSerializer(
+        posts, many=True, context={'request': request}
+    )
+    return _page(request, serializer.data, next_link)
+
+
+@safe_only
+@throttled('posts')
+async def post_detail(request, pk):
+    try:
+        post = await Post.objects.visible().select_related('author').aget(
+            pk=pk
+        )
+    except Post.DoesNotExist:
+        try:
+            post = await ArchivedPost.objects.visible().select_related(
+                'author'
+            ).aget(pk=pk)
+        except ArchivedPost.DoesNotExist:
+            raise NotFound()
+    return json_response(
+        PostSerializer(post, context={'request': request}).data
+    )
+
+
+@safe_only
+@throttled()
+async def comment_list(request, post_id):
+    queryset = Comment.objects.visible().select_related('author').filter(
+        post=post_id
+    )
+    paginator = AsyncKeysetPagination('created', page_size=50)
+    comments, next_link = await paginator.paginate(queryset, request)
+    if not comments:
+        # Комментарии архивного поста целиком лежат в архиве.
+        comments, next_link = await paginator.paginate(
+            ArchivedComment.objects.visible().select_related(
+                'author'
+            ).filter(post=post_id),
+            request,
+        )
+    return _page(
+        request, CommentSerializer(comments, many=True).data, next_link
+    )
+
+
+@safe_only
+@throttled()
+async def group_list(request):
+    groups = [group async for group in Group.objects.aiterator()]
+    return json_response(
+        GroupSerializer(groups, many=True).data
+    )
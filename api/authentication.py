@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import versions
+from .models import RevokedToken
+
+
+class LRUCache:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_tokens = LRUCache(settings.AUTH_CACHE['SIZE'], settings.AUTH_CACHE['TTL'])
+_users = LRUCache(settings.AUTH_CACHE['SIZE'], settings.AUTH_CACHE['TTL'])
+
+
+def _lifetime(token):
+    return token['exp'] - time.time()
+
+
+# Отзыв хранится в БД, а не в кэше: его видят все процессы, и он переживает
+# перезапуск, вытеснение и очистку кэша.
+def revoke(token):
+    expires = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    now = timezone.now()
+    if expires > now:
+        RevokedToken.objects.filter(expires__lt=now).delete()
+        RevokedToken.objects.bulk_create([RevokedToken(
+            jti=token[api_settings.JTI_CLAIM], expires=expires
+        )], ignore_conflicts=True)
+
+
+def is_revoked(token):
+    return RevokedToken.objects.filter(
+        jti=token[api_settings.JTI_CLAIM]
+    ).exists()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, которая не ходит в БД за уже знакомым токеном.
+
+    Пользователь хранится по jti токена вместе с версией тега user:<id>;
+    сохранение пользователя (смена пароля, деактивация) меняет версию.
+    Версии лежат в общем кэше API_CACHE_ALIAS, поэтому смену видят все
+    процессы (см. cache.check_shared_cache).
+    """
+
+    def get_validated_token(self, raw_token):
+        token = _tokens.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            _tokens.set(raw_token, token, _lifetime(token))
+        return token
+
+    def get_user(self, validated_token):
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if jti is None or user_id is None:
+            return super().get_user(validated_token)
+
+        version = versions([f'user:{user_id}'])[0]
+        cached = _users.get(jti)
+        if cached is not None and cached[1] == version:
+            return cached[0]
+        user = super().get_user(validated_token)
+        _users.set(jti, (user, version), _lifetime(validated_token))
+        return user
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import purge
+from .signals import batched, notify_saved
+
+
+class BulkModelMixin:
+    def get_bulk_save_kwargs(self):
+        return {'author': self.request.user}
+
+    def after_bulk_create(self, instances):
+        pass
+
+    def check_bulk_permissions(self, request, queryset):
+        for permission in self.get_permissions():
+            check = getattr(permission, 'has_bulk_permission', None)
+            if check is not None and not check(request, self, queryset):
+                self.permission_denied(request)
+
+    def get_bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError('Ожидается список объектов.')
+        if len(items) > settings.BULK_MAX_ITEMS:
+            raise ValidationError(
+                f'Не больше {settings.BULK_MAX_ITEMS} объектов за запрос.'
+            )
+        return items
+
+    def get_bulk_ids(self, items):
+        ids, errors = [], {}
+        for index, item in enumerate(items):
+            pk = item.get('id') if isinstance(item, dict) else item
+            if isinstance(pk, int) and not isinstance(pk, bool):
+                ids.append(pk)
+            else:
+                errors[index] = {'id': ['Ожидается целочисленный id.']}
+        if errors:
+            raise ValidationError(errors)
+        return ids
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        if request.method == 'POST':
+            return self.bulk_create(items)
+        if request.method == 'PATCH':
+            return self.bulk_update(items)
+        return self.bulk_destroy(items)
+
+    def bulk_create(self, items):
+        serializer = self.get_serializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        model = self.get_queryset().model
+        save_kwargs = self.get_bulk_save_kwargs()
+        with transaction.atomic(), batched():
+            instances = model.objects.bulk_create(
+                [model(**data, **save_kwargs)
+                 for data in serializer.validated_data]
+            )
+            notify_saved(instances, created=True)
+        self.after_bulk_create(instances)
+        return Response(
+            self.get_serializer(instances, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def bulk_update(self, items):
+        ids = self.get_bulk_ids(items)
+        queryset = self.get_queryset().filter(pk__in=ids)
+        self.check_bulk_permissions(self.request, queryset)
+        found = queryset.in_bulk()
+
+        serializers, errors = [], {}
+        for index, (pk, item) in enumerate(zip(ids, items)):
+            if pk not in found:
+                errors[index] = {'id': ['Объект не найден.']}
+                continue
+            serializer = self.get_serializer(
+                found[pk], data=item, partial=True
+            )
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+            serializers.append(serializer)
+        if errors:
+            raise ValidationError(errors)
+
+        fields = set()
+        for serializer in serializers:
+            for name, value in serializer.validated_data.items():
+                setattr(serializer.instance, name, value)
+                fields.add(name)
+        instances = [serializer.instance for serializer in serializers]
+        if fields:
+            # bulk_update не вызывает pre_save, auto_now заполняем сами.
+            for field in queryset.model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    for instance in instances:
+                        field.pre_save(instance, add=False)
+                    fields.add(field.name)
+            with transaction.atomic(), batched():
+                queryset.model.objects.bulk_update(instances, fields)
+                notify_saved(instances, created=False)
+        return Response(self.get_serializer(instances, many=True).data)
+
+    def bulk_destroy(self, items):
+        ids = self.get_bulk_ids(items)
+        queryset = self.get_queryset().filter(pk__in=ids)
+        self.check_bulk_permissions(self.request, queryset)
+        with transaction.atomic(), batched():
+            if hasattr(queryset, 'soft_delete'):
+                purge.delete(queryset)
+            else:
+                queryset.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
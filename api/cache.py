@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .routers import reading_from_replica
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+# Кэши, которые не видны другим процессам: версии тегов в них меняются
+# только у того процесса, что записывал.
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES[settings.API_CACHE_ALIAS]['BACKEND']
+    if backend not in LOCAL_BACKENDS:
+        return []
+    return [checks.Error(
+        f'Кэш {settings.API_CACHE_ALIAS!r} ({backend}) не общий для '
+        'процессов: сброс ответов и деактивация пользователей будут '
+        'видны только одному процессу.',
+        hint='Укажите CACHE_BACKEND, например '
+             'django.core.cache.backends.redis.RedisCache.',
+        id='api.E001',
+    )]
+
+
+def _tag_key(tag):
+    return f'api:tag:{tag}'
+
+
+def bump(*tags):
+    cache = _cache()
+    result = []
+    for tag in tags:
+        key = _tag_key(tag)
+        cache.add(key, time.time_ns(), None)
+        try:
+            result.append(cache.incr(key))
+        except ValueError:
+            result.append(time.time_ns())
+            cache.set(key, result[-1], None)
+    return result
+
+
+def bump_on_commit(*tags):
+    # Сбрасываем сразу и ещё раз после коммита: ответ, собранный другим
+    # процессом до коммита, не переживёт вторую смену версии.
+    bump(*tags)
+    transaction.on_commit(lambda: bump(*tags))
+
+
+def versions(tags):
+    cache = _cache()
+    keys = [_tag_key(tag) for tag in tags]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def response_key(request, tags):
+    parts = [request.path, request.accepted_renderer.format]
+    parts += sorted(f'{k}={v}' for k, v in request.query_params.lists())
+    parts += [f'{tag}@{version}'
+              for tag, version in zip(tags, versions(tags))]
+    return 'api:response:' + hashlib.sha1(
+        '\n'.join(parts).encode()
+    ).hexdigest()
+
+
+def _build(request, entry):
+    response = HttpResponse(
+        entry['content'], content_type=entry['content_type']
+    )
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['modified'])
+    return get_conditional_response(
+        request,
+        etag=entry['etag'],
+        last_modified=entry['modified'],
+        response=response,
+    )
+
+
+class CachedResponseMixin:
+    def get_cache_tags(self):
+        raise NotImplementedError
+
+    def cached(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        # hidden меняется при удалении группы или пользователя: их строки
+        # скрыты во многих ответах сразу, до каскада purge.
+        key = response_key(request, [*self.get_cache_tags(), 'hidden'])
+        entry = _cache().get(key)
+        if entry is not None:
+            return _build(request, entry)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+            'modified': int(time.time()),
+        }
+        # Реплика могла ещё не получить запись, сбросившую версию тега:
+        # такой ответ живёт не дольше окна, в котором отставание допустимо.
+        timeout = settings.API_CACHE_TIMEOUT
+        if reading_from_replica():
+            timeout = settings.REPLICA_STICKY_SECONDS
+        _cache().set(key, entry, timeout)
+        return _build(request, entry)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
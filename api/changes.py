@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.db import IntegrityError, connections, transaction
+
+# Типы объектов в журнале: model_name модели.
+TRACKED = ('group', 'post', 'comment', 'follow')
+# Попытки записи, если параллельный запрос вставил ту же строку
+# между нашими DELETE и INSERT.
+RECORD_ATTEMPTS = 5
+
+# {(модель, deleted): {pk: None}} внутри deferred().
+_pending = ContextVar('changes_pending', default=None)
+
+
+def record(model, *pks, deleted=False):
+    """Переносит объекты в конец журнала: одна строка на объект."""
+    from .models import Change
+
+    pending = _pending.get()
+    if pending is not None:
+        pending.setdefault((model, deleted), {}).update(dict.fromkeys(pks))
+        return
+    kind = model._meta.model_name
+    pks = list(dict.fromkeys(pks))
+    for attempt in range(RECORD_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                Change.objects.filter(kind=kind, object_id__in=pks).delete()
+                Change.objects.bulk_create([
+                    Change(kind=kind, object_id=pk, deleted=deleted)
+                    for pk in pks
+                ])
+            return
+        except IntegrityError:
+            if attempt == RECORD_ATTEMPTS - 1:
+                raise
+
+
+@contextmanager
+def deferred():
+    """Копит record() до конца блока: одна запись на модель."""
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    for (model, deleted), pks in pending.items():
+        record(model, *pks, deleted=deleted)
+
+
+def backfill(using='default'):
+    """Добавляет в журнал объекты, которых в нём ещё нет."""
+    from .models import Change
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    journal = quote(Change._meta.db_table)
+    with connection.cursor() as cursor:
+        for kind in TRACKED:
+            table = quote(apps.get_model('api', kind)._meta.db_table)
+            cursor.execute(
+                f'INSERT INTO {journal} (kind, object_id, deleted, changed) '
+                f'SELECT %s, t.id, %s, CURRENT_TIMESTAMP FROM {table} t '
+                f'WHERE NOT EXISTS (SELECT 1 FROM {journal} c '
+                f'WHERE c.kind = %s AND c.object_id = t.id) ORDER BY t.id',
+                [kind, False, kind],
+            )
@@ -0,0 +1,159 @@
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = re.compile(
+    r'^(text/|application/(json|x-ndjson|javascript|xml|yaml|x-yaml))'
+)
+
+
+def accepted_encodings(header):
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        quality = float(match.group(1)) if match else 1
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+class Gzip:
+    name = 'gzip'
+
+    def __init__(self, options):
+        self._compressor = zlib.compressobj(
+            options['GZIP_LEVEL'], zlib.DEFLATED, 31
+        )
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class Brotli:
+    name = 'br'
+
+    def __init__(self, options):
+        self._compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT, quality=options['BROTLI_QUALITY']
+        )
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def choose_codec(request):
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return Brotli
+    if accepted.get('gzip', 0) > 0:
+        return Gzip
+    return None
+
+
+class CompressionMiddleware:
+    """brotli или gzip по Accept-Encoding для ответов больше MIN_SIZE.
+
+    Потоковые ответы сжимаются на лету, сжатые данные отдаются клиенту
+    не реже чем раз в FLUSH_SIZE байт исходных данных.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = settings.COMPRESSION
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if (
+            response.has_header('Content-Encoding')
+            or not COMPRESSIBLE.match(content_type)
+            or (not response.streaming
+                and len(response.content) < self.options['MIN_SIZE'])
+        ):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codec = choose_codec(request)
+        if codec is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.acompress(
+                    codec(self.options), response.streaming_content
+                )
+            else:
+                response.streaming_content = self.compress(
+                    codec(self.options), response.streaming_content
+                )
+            del response['Content-Length']
+        else:
+            compressor = codec(self.options)
+            content = compressor.compress(response.content)
+            content += compressor.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # Тело меняется, поэтому сильный ETag становится слабым.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = codec.name
+        return response
+
+    def compress(self, compressor, chunks):
+        pending = 0
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= self.options['FLUSH_SIZE']:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+
+    async def acompress(self, compressor, chunks):
+        pending = 0
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= self.options['FLUSH_SIZE']:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
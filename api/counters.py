@@ -0,0 +1,106 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Дельты и профили для создания внутри deferred().
+_pending = ContextVar('counters_pending', default=None)
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), Value(0))
+
+
+def bump(model, pk, **deltas):
+    pending = _pending.get()
+    if pending is not None:
+        for field, delta in deltas.items():
+            pending['deltas'][model, field][pk] += delta
+        return 1
+    # _base_manager: счётчики меняются и у мягко удалённых строк.
+    return model._base_manager.filter(pk=pk).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def bump_many(model, field, deltas):
+    """Прибавляет deltas {pk: дельта}: один UPDATE на значение дельты."""
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    return sum(
+        model._base_manager.filter(pk__in=pks).update(
+            **{field: F(field) + delta}
+        )
+        for delta, pks in by_delta.items()
+    )
+
+
+def bump_profile(user_id, **deltas):
+    from .models import Profile
+
+    pending = _pending.get()
+    if pending is not None:
+        pending['profiles'].add(user_id)
+    if not bump(Profile, user_id, **deltas):
+        Profile.objects.get_or_create(user_id=user_id)
+        bump(Profile, user_id, **deltas)
+
+
+@contextmanager
+def deferred():
+    """Копит bump() до конца блока и пишет их через bump_many()."""
+    from .models import Profile
+
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {'deltas': defaultdict(Counter), 'profiles': set()}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    if pending['profiles']:
+        Profile.objects.bulk_create(
+            [Profile(user_id=pk) for pk in pending['profiles']],
+            ignore_conflicts=True,
+        )
+    for (model, field), deltas in pending['deltas'].items():
+        bump_many(model, field, deltas)
+
+
+def rebuild():
+    from django.contrib.auth.models import User
+
+    from .models import Post, Comment, Group, Follow, Profile, \
+        ArchivedPost, ArchivedComment
+
+    Profile.objects.bulk_create(
+        [Profile(user_id=pk) for pk in User.objects.filter(
+            profile__isnull=True
+        ).values_list('pk', flat=True)],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    Post.objects.update(comment_count=_count(Comment.objects, 'post'))
+    ArchivedPost.objects.update(
+        comment_count=_count(ArchivedComment.objects, 'post')
+    )
+    Group.objects.update(
+        post_count=_count(Post.objects, 'group')
+        + _count(ArchivedPost.objects, 'group')
+    )
+    Profile.objects.update(
+        follower_count=_count(Follow.objects, 'following'),
+        following_count=_count(Follow.objects, 'user'),
+    )
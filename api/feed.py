@@ -0,0 +1,143 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import F, Max, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post, Follow, FeedEntry, Profile
+
+
+def _entries(user_id, posts):
+    return [
+        FeedEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for post in posts
+    ]
+
+
+def celebrity_ids(user):
+    return list(Follow.objects.filter(
+        user=user,
+        following__profile__follower_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list('following_id', flat=True))
+
+
+def fan_out(*posts):
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    limit = settings.FEED_FANOUT_LIMIT
+    for author_id, author_posts in by_author.items():
+        followers = list(
+            Follow.objects.filter(following=author_id)
+            .values_list('user_id', flat=True)[:limit + 1]
+        )
+        if len(followers) > limit:
+            continue
+        FeedEntry.objects.bulk_create(
+            [entry for user_id in followers
+             for entry in _entries(user_id, author_posts)],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+def backfill(*follows):
+    authors = {follow.following_id for follow in follows}
+    authors -= set(Profile.objects.filter(
+        user__in=authors,
+        follower_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list('user_id', flat=True))
+    if not authors:
+        return
+    # Последние FEED_BACKFILL постов каждого автора одним запросом.
+    posts = Post.objects.filter(author__in=authors).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('author'),
+            order_by=F('pub_date').desc(),
+        )
+    ).filter(position__lte=settings.FEED_BACKFILL).only(
+        'pk', 'author', 'pub_date'
+    )
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    FeedEntry.objects.bulk_create(
+        [entry for follow in follows for entry in _entries(
+            follow.user_id, by_author[follow.following_id]
+        )],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def drop(follow):
+    FeedEntry.objects.filter(
+        user=follow.user_id, post__author=follow.following_id
+    ).delete()
+
+
+def _pull(user, posts):
+    posts = list(posts.order_by().only('pk', 'author', 'pub_date'))
+    FeedEntry.objects.bulk_create(
+        _entries(user.pk, posts), batch_size=1000, ignore_conflicts=True
+    )
+    return posts
+
+
+def _per_author(posts, *order_by):
+    return posts.annotate(
+        position=Window(
+            RowNumber(), partition_by=F('author'), order_by=order_by
+        )
+    ).filter(position__lte=settings.FEED_BACKFILL)
+
+
+def _after(author, last, pk):
+    after = Q(pub_date__gt=last)
+    if pk is not None:
+        after |= Q(pub_date=last, pk__gt=pk)
+    return Q(author=author) & after
+
+
+def pull_celebrity_posts(user):
+    authors = celebrity_ids(user)
+    if not authors:
+        return
+    # Отметка своя у каждого автора: подписка на нового знаменитого автора
+    # не сдвигает её для остальных. Посты с датой отметки уже в ленте.
+    marks = {
+        author: (last, None) for author, last in FeedEntry.objects.filter(
+            user=user, post__author__in=authors
+        ).order_by().values_list('post__author').annotate(
+            last=Max('pub_date')
+        )
+    }
+    new = [author for author in authors if author not in marks]
+    if new:
+        # Как backfill при подписке: последние FEED_BACKFILL постов.
+        _pull(user, _per_author(
+            Post.objects.filter(author__in=new), F('pub_date').desc()
+        ))
+    # Пропущенное читается страницами по FEED_BACKFILL постов на автора,
+    # пока у каждого не кончатся новые, но не больше FEED_PULL_PAGES
+    # страниц за запрос: остальное дочитают следующие запросы ленты.
+    pages = settings.FEED_PULL_PAGES
+    while marks and pages:
+        pages -= 1
+        posts = _pull(user, _per_author(
+            Post.objects.filter(reduce(or_, (
+                _after(author, *mark) for author, mark in marks.items()
+            ))),
+            F('pub_date').asc(), F('pk').asc(),
+        ))
+        pulled = defaultdict(list)
+        for post in posts:
+            pulled[post.author_id].append(post)
+        marks = {
+            author: max((post.pub_date, post.pk) for post in page)
+            for author, page in pulled.items()
+            if len(page) == settings.FEED_BACKFILL
+        }
@@ -0,0 +1,143 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render(source, media_root, target, widths, formats, quality):
+    from PIL import Image, ImageOps
+
+    os.makedirs(os.path.join(media_root, target), exist_ok=True)
+    renditions = {fmt: {} for fmt in formats}
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'A' in image.getbands() else 'RGB'
+            )
+        for width in sorted(widths):
+            width = min(width, image.width)
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                frame = resized.convert('RGB') if fmt == 'jpeg' else resized
+                name = f'{target}{width}.{EXTENSIONS[fmt]}'
+                frame.save(
+                    os.path.join(media_root, name),
+                    format=fmt.upper(),
+                    quality=quality,
+                )
+                renditions[fmt][str(width)] = name
+            if width == image.width:
+                break
+    return renditions
+
+
+def rendition_dir(pk):
+    return f'posts/renditions/{pk}/'
+
+
+def _target(pk, name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{rendition_dir(pk)}{stem}/'
+
+
+def _remove_stale(pk, keep):
+    """Удаляет копии прежних изображений поста, кроме каталога keep."""
+    root = os.path.join(settings.MEDIA_ROOT, rendition_dir(pk))
+    try:
+        entries = os.listdir(root)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if f'{rendition_dir(pk)}{entry}/' != keep:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_RENDITIONS['WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _executor
+
+
+def _save(pk, name, renditions):
+    from . import changes
+    from .cache import bump_on_commit
+    from .models import Post
+
+    target = _target(pk, name)
+    if Post.objects.filter(pk=pk, image=name).update(renditions=renditions):
+        changes.record(Post, pk)
+        bump_on_commit('posts', f'post:{pk}')
+        # Копии заменённого изображения больше не нужны.
+        _remove_stale(pk, target)
+    else:
+        # Изображение успели заменить или пост удалили.
+        shutil.rmtree(
+            os.path.join(settings.MEDIA_ROOT, target), ignore_errors=True
+        )
+
+
+def _store(pk, name, caller, future):
+    try:
+        renditions = future.result()
+    except Exception:
+        logger.exception('Не удалось обработать изображение поста %s', pk)
+        return
+    try:
+        _save(pk, name, renditions)
+    finally:
+        if threading.get_ident() != caller:
+            connection.close()
+
+
+def schedule(post):
+    if not post.image:
+        return
+    conf = settings.IMAGE_RENDITIONS
+    args = (
+        post.image.path,
+        settings.MEDIA_ROOT,
+        _target(post.pk, post.image.name),
+        conf['WIDTHS'],
+        conf['FORMATS'],
+        conf['QUALITY'],
+    )
+    if not conf['WORKERS']:
+        try:
+            renditions = render(*args)
+        except Exception:
+            logger.exception('Не удалось обработать изображение поста %s',
+                             post.pk)
+            return
+        _save(post.pk, post.image.name, renditions)
+        return
+    future = _get_executor().submit(render, *args)
+    future.add_done_callback(
+        partial(_store, post.pk, post.image.name, threading.get_ident())
+    )
+
+
+def discard(pk):
+    shutil.rmtree(
+        os.path.join(settings.MEDIA_ROOT, rendition_dir(pk)),
+        ignore_errors=True,
+    )
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты старше ARCHIVE["DAYS"] дней вместе с комментариями '
+        'в архивные таблицы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE['DAYS'],
+            help='Возраст поста в днях, после которого он уходит в архив'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.ARCHIVE['BATCH_SIZE'],
+            help='Постов за одну транзакцию'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=settings.ARCHIVE['PAUSE'],
+            help='Пауза между транзакциями, секунд'
+        )
+
+    def handle(self, *args, **options):
+        total = archive.worker.drain(
+            options['batch_size'], options['pause'], days=options['days']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Перенесено постов: {total}'))
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Comment, Follow, Group, Post
+
+# Что в плане выполнения означает чтение всей таблицы или сортировку
+# без индекса.
+PROBLEMS = {
+    'sqlite': ('SCAN ', 'USE TEMP B-TREE'),
+    'postgresql': ('Seq Scan', 'Sort'),
+}
+# Чтение всей таблицы, которое ожидаемо: виртуальные FTS-таблицы
+# и обход по индексу.
+ALLOWED = ('VIRTUAL TABLE', 'USING INDEX', 'USING COVERING INDEX')
+
+
+def list_urls(user, group, post):
+    return (
+        '/api/v1/posts/',
+        f'/api/v1/posts/?group={group.pk}',
+        '/api/v1/posts/?expand=author,group,comments',
+        f'/api/v1/posts/{post.pk}/comments/',
+        '/api/v1/follow/',
+        f'/api/v1/follow/?search={user.username}',
+        '/api/v1/follow/mutual/',
+        f'/api/v1/follow/followers/?username={user.username}',
+        f'/api/v1/follow/following/?username={user.username}',
+        f'/api/v1/follow/check/?username={user.username},explain-author',
+        '/api/v1/group/',
+        '/api/v1/feed/',
+        '/api/v1/search/?q=пост',
+        '/api/v1/search/?q=пост&type=comments',
+        '/api/v1/trending/',
+        f'/api/v1/export/?since={post.pub_date.isoformat()}'.replace(
+            '+', '%2B'
+        ),
+        '/api/v1/async/posts/',
+        f'/api/v1/async/posts/?group={group.pk}',
+        f'/api/v1/async/posts/{post.pk}/comments/',
+        '/api/v1/async/group/',
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для запросов всех списочных эндпоинтов и падает, '
+        'если какой-то из них читает таблицу целиком или сортирует без индекса'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех запросов'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in PROBLEMS:
+            raise CommandError(f'{connection.vendor} не поддерживается')
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # На маленьких таблицах планировщик и так выберет Seq Scan,
+                # проверяется именно наличие подходящего индекса.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for url, sql in self.capture():
+                plan = self.explain(sql)
+                bad = [
+                    line for line in plan
+                    if any(problem in line for problem in PROBLEMS[
+                        connection.vendor
+                    ]) and not any(ok in line for ok in ALLOWED)
+                ]
+                if bad or options['verbose_plans']:
+                    self.stdout.write(f'{url}\n  {sql}')
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+                if bad:
+                    failures.append(f'{url}: {"; ".join(bad)}')
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                'Запросы без подходящего индекса:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
+
+    def capture(self):
+        user = User.objects.create(username='explain-user')
+        author = User.objects.create(username='explain-author')
+        group = Group.objects.create(title='Группа', slug='explain')
+        post = Post.objects.create(text='Пост', author=author, group=group)
+        Comment.objects.create(post=post, author=author, text='Пост')
+        Follow.objects.create(user=user, following=author)
+
+        host = next((
+            host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'
+        ), 'localhost')
+        client = APIClient(SERVER_NAME=host)
+        client.force_authenticate(user)
+        for url in list_urls(user, group, post):
+            caches[settings.API_CACHE_ALIAS].clear()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: статус {response.status_code}')
+            for query in context.captured_queries:
+                if query['sql'].lstrip().upper().startswith('SELECT'):
+                    yield url, query['sql']
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import purge
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из базы мягко удалённые посты, группы, комментарии '
+        'и пользователей вместе со связанными строками'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.PURGE['BATCH_SIZE'],
+            help='Строк за одну транзакцию'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=settings.PURGE['PAUSE'],
+            help='Пауза между транзакциями, секунд'
+        )
+
+    def handle(self, *args, **options):
+        total = purge.worker.drain(options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано строк: {total}'))
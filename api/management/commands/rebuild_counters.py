@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики комментариев, постов и подписок'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counters.rebuild()
+        caches[settings.API_CACHE_ALIAS].clear()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        search.install(using=options['database'])
+        search.rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Индекс перестроен'))
@@ -0,0 +1,119 @@
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import changes, counters
+from api.models import Comment, Follow, Group, Post
+
+SIZES = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+WORDS = (
+    'яндекс практикум python django пост группа подписка лента новости '
+    'котики погода город книга музыка кино спорт путешествие работа код '
+    'тест база запрос индекс кэш очередь сервер клиент ответ время'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', choices=SIZES, default='10k',
+            help='Число постов; остальное считается от него'
+        )
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--groups', type=int)
+        parser.add_argument('--posts', type=int)
+        parser.add_argument('--comments', type=int)
+        parser.add_argument('--follows', type=int)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--password', default='bench',
+            help='Пароль всех созданных пользователей bench<N>'
+        )
+
+    def handle(self, *args, **options):
+        posts = options['posts'] or SIZES[options['size']]
+        sizes = {
+            'users': options['users'] or max(10, posts // 20),
+            'groups': options['groups'] or max(10, posts // 1000),
+            'posts': posts,
+            'comments': options['comments'] or posts * 2,
+            'follows': options['follows'] or posts // 2,
+        }
+        if User.objects.filter(username__startswith='bench').exists():
+            raise CommandError('База уже заполнена пользователями bench<N>')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        password = make_password(options['password'])
+        users = self.create(User, sizes['users'], lambda n: User(
+            username=f'bench{n}', password=password
+        ))
+        groups = self.create(Group, sizes['groups'], lambda n: Group(
+            title=f'Группа {n}', slug=f'bench-{n}',
+            description=self.text(10),
+        ))
+        posts = self.create(Post, sizes['posts'], lambda n: Post(
+            text=self.text(60),
+            author_id=self.random.choice(users),
+            group_id=(
+                self.random.choice(groups)
+                if self.random.random() < 0.7 else None
+            ),
+        ))
+        self.create(Comment, sizes['comments'], lambda n: Comment(
+            post_id=self.random.choice(posts),
+            author_id=self.random.choice(users),
+            text=self.text(15),
+        ))
+        self.create(Follow, sizes['follows'], lambda n: self.follow(users))
+
+        self.stdout.write('Пересчёт счётчиков')
+        with transaction.atomic():
+            counters.rebuild()
+        # bulk_create не шлёт сигналов: журнал изменений заполняется здесь.
+        changes.backfill()
+        caches[settings.API_CACHE_ALIAS].clear()
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{name}: {count}' for name, count in sizes.items())
+        ))
+
+    def text(self, words):
+        return ' '.join(self.random.choices(WORDS, k=words)).capitalize()
+
+    def follow(self, users):
+        # Степенное распределение: у первых пользователей больше подписчиков.
+        following = users[int(len(users) * self.random.random() ** 3)]
+        user = self.random.choice(users)
+        if user == following:
+            user = users[(users.index(user) + 1) % len(users)]
+        return Follow(user_id=user, following_id=following)
+
+    def create(self, model, total, build):
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        start = last.first() or 0
+        for offset in range(0, total, self.batch_size):
+            count = min(self.batch_size, total - offset)
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    [build(offset + n) for n in range(count)],
+                    ignore_conflicts=model is Follow,
+                )
+        # bulk_create выдаёт ключи подряд, список из миллионов id не нужен.
+        return range(start + 1, (last.first() or 0) + 1)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import trending
+
+
+class Command(BaseCommand):
+    help = 'Учитывает в весах трендов новые комментарии и посты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.TRENDING['BATCH_SIZE'],
+            help='Строк за одну транзакцию'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=settings.TRENDING['PAUSE'],
+            help='Пауза между транзакциями, секунд'
+        )
+
+    def handle(self, *args, **options):
+        total = trending.worker.drain(options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Учтено строк: {total}'))
@@ -0,0 +1,282 @@
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework.serializers import ListSerializer
+
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = tuple(2 ** n for n in range(8, 24, 2))
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=('view', 'action')):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        for labels, counts, total, count in sorted(series):
+            names = ','.join(
+                f'{name}="{value}"' for name, value in zip(self.labels, labels)
+            )
+            cumulative = 0
+            for bound, hits in zip(self.buckets + ('+Inf',), counts):
+                cumulative += hits
+                yield (
+                    f'{self.name}_bucket{{{names},le="{bound}"}} {cumulative}'
+                )
+            yield f'{self.name}_sum{{{names}}} {total}'
+            yield f'{self.name}_count{{{names}}} {count}'
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса',
+    DURATION_BUCKETS, ('view', 'action', 'status'),
+)
+DB_QUERIES = Histogram(
+    'api_db_queries', 'SQL-запросов на запрос', QUERY_BUCKETS
+)
+DB_DURATION = Histogram(
+    'api_db_duration_seconds', 'Время SQL-запросов на запрос',
+    DURATION_BUCKETS,
+)
+SERIALIZE_DURATION = Histogram(
+    'api_serialize_duration_seconds',
+    'Время сериализации и рендеринга ответа', DURATION_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'api_response_size_bytes', 'Размер тела ответа', SIZE_BUCKETS
+)
+HISTOGRAMS = (
+    REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZE_DURATION,
+    RESPONSE_SIZE,
+)
+
+_current = ContextVar('api_metrics', default=None)
+
+
+@contextmanager
+def measure(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] += time.perf_counter() - started
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings['db'] += time.perf_counter() - started
+        timings['queries'] += 1
+
+
+@receiver(connection_created)
+def install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class TimedListSerializer(ListSerializer):
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+
+class Sampler:
+    """Сэмплирующий профайлер: раз в interval снимает стек потока запроса.
+
+    Результат в формате folded stacks для flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_filename}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+def _profiler(options):
+    if options['PROFILE_FORMAT'] == 'folded':
+        return Sampler(options['PROFILE_INTERVAL']), 'folded'
+    return cProfile.Profile(), 'prof'
+
+
+def _labels(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched', request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return (
+        match.view_name,
+        actions.get(request.method.lower(), request.method.lower()),
+    )
+
+
+class MetricsMiddleware:
+    """Время запроса, SQL, сериализации и размер ответа по view и action."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = settings.METRICS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current.set(Counter())
+        profiler = None
+        if random.random() < self.options['PROFILE_SAMPLE_RATE']:
+            profiler, extension = _profiler(self.options)
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                if elapsed >= self.options['PROFILE_THRESHOLD']:
+                    self.dump(profiler, extension, request, elapsed)
+            self.record(request, response, elapsed)
+        finally:
+            _current.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = _current.set(Counter())
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.record(request, response, time.perf_counter() - started)
+        finally:
+            _current.reset(token)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = _current.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings['serialize'] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, response, elapsed):
+        timings = _current.get()
+        view, action = _labels(request)
+        labels = (view, action)
+        REQUEST_DURATION.observe(
+            (view, action, f'{response.status_code // 100}xx'), elapsed
+        )
+        DB_QUERIES.observe(labels, timings['queries'])
+        DB_DURATION.observe(labels, timings['db'])
+        SERIALIZE_DURATION.observe(labels, timings['serialize'])
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+
+    def dump(self, profiler, extension, request, elapsed):
+        directory = self.options['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        view, action = _labels(request)
+        name = f'{view}.{action}.{time.time():.0f}.{elapsed * 1000:.0f}ms'
+        profiler.dump_stats(os.path.join(directory, f'{name}.{extension}'))
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    return HttpResponse(
+        render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    # Копия counters.rebuild на момент миграции: без архива и мягкого
+    # удаления, которые появятся позже.
+    User = apps.get_model('auth', 'User')
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    Group = apps.get_model('api', 'Group')
+    Follow = apps.get_model('api', 'Follow')
+    Profile = apps.get_model('api', 'Profile')
+
+    Profile.objects.bulk_create(
+        [Profile(user_id=pk) for pk in User.objects.filter(
+            profile__isnull=True
+        ).values_list('pk', flat=True)],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    Post.objects.update(comment_count=_count(Comment.objects, 'post'))
+    Group.objects.update(post_count=_count(Post.objects, 'group'))
+    Profile.objects.update(
+        follower_count=_count(Follow.objects, 'following'),
+        following_count=_count(Follow.objects, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0015_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('follower_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'Профиль',
+                'verbose_name_plural': 'Профили',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
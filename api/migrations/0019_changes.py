@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+def fill_changes(apps, schema_editor):
+    # Копия changes.backfill на момент миграции: журнал ещё пуст, в него
+    # попадает каждый существующий объект.
+    quote = schema_editor.connection.ops.quote_name
+    journal = quote(apps.get_model('api', 'Change')._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        for kind in ('group', 'post', 'comment', 'follow'):
+            table = quote(apps.get_model('api', kind)._meta.db_table)
+            cursor.execute(
+                f'INSERT INTO {journal} (kind, object_id, deleted, changed) '
+                f'SELECT %s, t.id, %s, CURRENT_TIMESTAMP FROM {table} t '
+                f'ORDER BY t.id',
+                [kind, False],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=16, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удалён')),
+                ('changed', models.DateTimeField(auto_now=True, verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение',
+                'verbose_name_plural': 'Журнал изменений',
+                'ordering': ['id'],
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(fill_changes, migrations.RunPython.noop),
+    ]
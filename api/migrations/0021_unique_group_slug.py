@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+def dedupe_slugs(apps, schema_editor):
+    # Первая группа сохраняет адрес, у остальных к нему добавляется id.
+    Group = apps.get_model('api', 'Group')
+    seen = set()
+    for group in Group.objects.order_by('pk').only('pk', 'slug'):
+        slug = group.slug or 'group'
+        if slug in seen:
+            slug = f'{slug[:40]}-{group.pk}'
+        if slug != group.slug:
+            Group.objects.filter(pk=group.pk).update(slug=slug)
+        seen.add(slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='group',
+            name='slug',
+            field=models.SlugField(unique=True, verbose_name='Адрес'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Точка отсчёта весов')),
+                ('last_comment', models.PositiveBigIntegerField(default=0, verbose_name='Последний учтённый комментарий')),
+                ('last_post', models.PositiveBigIntegerField(default=0, verbose_name='Последний учтённый пост')),
+            ],
+            options={
+                'verbose_name': 'Состояние трендов',
+                'verbose_name_plural': 'Состояние трендов',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID объекта')),
+                ('score', models.FloatField(default=0, verbose_name='Вес')),
+            ],
+            options={
+                'verbose_name': 'Вес в трендах',
+                'verbose_name_plural': 'Тренды',
+                'indexes': [models.Index(fields=['kind', 'score'], name='trending_kind_score')],
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+    ]
@@ -1,14 +1,130 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
 
 
-class Post(models.Model):
+class DerivedFieldsModel(models.Model):
+    """derived_fields меняются только через update(), save() их не пишет."""
+    derived_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Как и save() Django, не загруженные .only() поля не пишем.
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.get_derived_fields()
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    def get_derived_fields(self):
+        return self.derived_fields
+
+
+class VisibleQuerySet(models.QuerySet):
+    def visible(self):
+        """Скрывает строки, родитель которых помечен удалённым.
+
+        Каскад purge помечает дочерние строки фоном и пачками, а до тех
+        пор публичные запросы отсекают их по hidden_with модели.
+        """
+        return self.filter(visible_q(self.model))
+
+
+def visible_q(model, prefix=''):
+    return models.Q(**{
+        f'{prefix}{parent}__deleted_at__isnull': True
+        for parent in model.hidden_with
+    })
+
+
+class SoftDeleteQuerySet(VisibleQuerySet):
+    def soft_delete(self):
+        """Помечает строки удалёнными; сами строки удаляет purge.
+
+        Для помеченных объектов сразу шлётся post_delete, чтобы счётчики,
+        журнал изменений и кэш обновились как при обычном удалении.
+        """
+        from .signals import batched
+
+        instances = list(self.filter(deleted_at__isnull=True))
+        now = timezone.now()
+        with transaction.atomic(using=self.db), batched():
+            self.model._base_manager.filter(
+                pk__in=[instance.pk for instance in instances]
+            ).update(deleted_at=now)
+            for instance in instances:
+                instance.deleted_at = now
+                post_delete.send(
+                    sender=self.model,
+                    instance=instance,
+                    using=self.db,
+                    origin=instance,
+                )
+        return len(instances)
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+def deleted_index(name):
+    # Частичный индекс только по помеченным строкам: для deleted_at IS NULL
+    # планировщик его не выберет и сохранит индексы сортировки.
+    return models.Index(
+        fields=['deleted_at'],
+        condition=models.Q(deleted_at__isnull=False),
+        name=name,
+    )
+
+
+class SoftDeleteModel(DerivedFieldsModel):
+    # Пути к родителям, вместе с удалением которых строка скрывается.
+    hidden_with = ()
+
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Дата удаления"
+    )
+
+    # objects скрывает удалённые строки, all_objects видит все.
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def get_derived_fields(self):
+        # Иначе save() старой копии объекта снял бы пометку об удалении.
+        return (*super().get_derived_fields(), 'deleted_at')
+
+    def soft_delete(self):
+        return type(self).objects.filter(pk=self.pk).soft_delete()
+
+
+class Post(SoftDeleteModel):
+    derived_fields = ('comment_count', 'renditions')
+    hidden_with = ('group', 'author__profile')
+
     text = models.TextField(verbose_name="Текст поста")
     pub_date = models.DateTimeField(
         auto_now_add=True,
         db_index=True,
         verbose_name="Дата публикации"
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения"
+    )
     author = models.ForeignKey(
         User,
         null=True,
@@ -23,34 +139,72 @@ class Post(models.Model):
         verbose_name="Сообщество",
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Уменьшенные копии изображения"
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Число комментариев"
+    )
 
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
         ordering = ["-pub_date"]
+        # По возрастанию: обратный обход индекса отдаёт и -pub_date,
+        # и -pk для равных дат, поэтому курсорам не нужна сортировка.
+        indexes = [
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_pub_date'
+            ),
+            models.Index(
+                fields=['author', 'pub_date'], name='post_author_pub_date'
+            ),
+            deleted_index('post_deleted'),
+        ]
 
     def __str__(self):
         return self.text
 
 
-class Group(models.Model):
+class Group(SoftDeleteModel):
+    derived_fields = ('post_count',)
+
     title = models.CharField(
         max_length=200,
         verbose_name="Название сообщества"
     )
-    slug = models.SlugField(verbose_name="Адрес")
+    slug = models.SlugField(unique=True, verbose_name="Адрес")
     description = models.TextField(verbose_name="Краткое описание")
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения"
+    )
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Число постов"
+    )
 
     class Meta:
         verbose_name = "Сообщество"
         verbose_name_plural = "Сообщества"
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=['title'], name='group_title'),
+            deleted_index('group_deleted'),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Comment(models.Model):
+class Comment(SoftDeleteModel):
+    hidden_with = (
+        'post', 'post__group', 'post__author__profile', 'author__profile'
+    )
+
     post = models.ForeignKey(
         Post,
         null=True,
@@ -70,17 +224,125 @@ class Comment(models.Model):
         auto_now_add=True,
         verbose_name="Дата публикации"
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения"
+    )
 
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ["created"]
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created'
+            ),
+            deleted_index('comment_deleted'),
+        ]
+
+    def __str__(self):
+        return self.text
+
+
+# Посты старше ARCHIVE['DAYS'] дней переносятся сюда вместе со всеми
+# комментариями, id сохраняются. Архив только читается: даты копируются
+# как есть, счётчики больше не меняются.
+class ArchivedPost(models.Model):
+    hidden_with = Post.hidden_with
+
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField(verbose_name="Текст поста")
+    pub_date = models.DateTimeField(
+        db_index=True,
+        verbose_name="Дата публикации"
+    )
+    updated = models.DateTimeField(verbose_name="Дата изменения")
+    author = models.ForeignKey(
+        User,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="archived_posts",
+        verbose_name="Автор")
+    group = models.ForeignKey(
+        'Group',
+        on_delete=models.CASCADE,
+        related_name="archived_posts",
+        blank=True, null=True,
+        verbose_name="Сообщество",
+    )
+    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Уменьшенные копии изображения"
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Число комментариев"
+    )
+
+    objects = VisibleQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Пост в архиве"
+        verbose_name_plural = "Архив постов"
+        ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='archived_post_group_pub_date'
+            ),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='archived_post_author_pub_date'
+            ),
+        ]
+
+    def __str__(self):
+        return self.text
+
+
+class ArchivedComment(models.Model):
+    hidden_with = ('post__group', 'post__author__profile', 'author__profile')
+
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name="comments",
+        verbose_name="Пост"
+    )
+    author = models.ForeignKey(
+        User,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="archived_comments",
+        verbose_name="Автор"
+    )
+    text = models.TextField(verbose_name="Текст комментария")
+    created = models.DateTimeField(verbose_name="Дата публикации")
+    updated = models.DateTimeField(verbose_name="Дата изменения")
+
+    objects = VisibleQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Комментарий в архиве"
+        verbose_name_plural = "Архив комментариев"
+        ordering = ["created"]
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='archived_comment_post_created'
+            ),
+        ]
 
     def __str__(self):
         return self.text
 
 
 class Follow(models.Model):
+    hidden_with = ('user__profile', 'following__profile')
+
     user = models.ForeignKey(
         User,
         null=True,
@@ -96,8 +358,15 @@ class Follow(models.Model):
         verbose_name="Автор"
     )
 
+    objects = VisibleQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'following')
+        indexes = [
+            models.Index(
+                fields=['following', 'user'], name='follow_following_user'
+            ),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
         ordering = ["following"]
@@ -105,3 +374,139 @@ class Follow(models.Model):
     def __str__(self):
         return f"{self.user} подписан на {self.following}"
 
+
+class Profile(SoftDeleteModel):
+    derived_fields = ('follower_count', 'following_count')
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="profile",
+        verbose_name="Пользователь"
+    )
+    follower_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Число подписчиков"
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Число подписок"
+    )
+
+    class Meta:
+        indexes = [deleted_index('profile_deleted')]
+        verbose_name = "Профиль"
+        verbose_name_plural = "Профили"
+
+    def __str__(self):
+        return str(self.user)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Читатель"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Пост"
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [models.Index(fields=['user', '-pub_date'])]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Лента"
+        ordering = ["-pub_date"]
+
+    def __str__(self):
+        return f"{self.post} в ленте {self.user}"
+
+
+class Change(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=16, verbose_name="Тип объекта")
+    object_id = models.PositiveBigIntegerField(verbose_name="ID объекта")
+    deleted = models.BooleanField(default=False, verbose_name="Удалён")
+    changed = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Время изменения"
+    )
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        ordering = ['id']
+        verbose_name = "Изменение"
+        verbose_name_plural = "Журнал изменений"
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class TrendingScore(models.Model):
+    # score — сумма 2 ** ((t - epoch) / HALF_LIFE) по комментариям и постам,
+    # где epoch общий для всех строк (TrendingState): порядок по score
+    # совпадает с порядком по затухшему к текущему моменту весу.
+    kind = models.CharField(max_length=16, verbose_name="Тип объекта")
+    object_id = models.PositiveBigIntegerField(verbose_name="ID объекта")
+    score = models.FloatField(default=0, verbose_name="Вес")
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        indexes = [
+            models.Index(fields=['kind', 'score'], name='trending_kind_score'),
+        ]
+        verbose_name = "Вес в трендах"
+        verbose_name_plural = "Тренды"
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.score}"
+
+
+class TrendingState(models.Model):
+    epoch = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Точка отсчёта весов"
+    )
+    last_comment = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Последний учтённый комментарий"
+    )
+    last_post = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Последний учтённый пост"
+    )
+
+    class Meta:
+        verbose_name = "Состояние трендов"
+        verbose_name_plural = "Состояние трендов"
+
+    def __str__(self):
+        return f"{self.last_post}/{self.last_comment}"
+
+
+class RevokedToken(models.Model):
+    # Отозванные refresh-токены по jti: строка нужна только до истечения
+    # срока токена, после него токен отклоняется и без неё.
+    jti = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name="Идентификатор токена"
+    )
+    expires = models.DateTimeField(
+        db_index=True,
+        verbose_name="Срок действия"
+    )
+
+    class Meta:
+        verbose_name = "Отозванный токен"
+        verbose_name_plural = "Отозванные токены"
+
+    def __str__(self):
+        return self.jti
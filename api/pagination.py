@@ -0,0 +1,168 @@
+import binascii
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class _Keyset:
+    """Запрос, который CursorPagination фильтрует по позиции «значение|pk».
+
+    Условие по первому полю ordering дополняется вторым, pk, для строк
+    с равным значением.
+    """
+
+    def __init__(self, queryset, ordering=()):
+        self.queryset = queryset
+        self.ordering = ordering
+
+    def order_by(self, *fields):
+        return _Keyset(self.queryset.order_by(*fields), fields)
+
+    def filter(self, **kwargs):
+        (lookup, position), = kwargs.items()
+        field, operator = lookup.rsplit('__', 1)
+        value, pk = position.rsplit('|', 1)
+        first, second = self.ordering[:2]
+        if first.startswith('-') != second.startswith('-'):
+            operator = 'gt' if operator == 'lt' else 'lt'
+        return _Keyset(self.queryset.filter(
+            Q(**{lookup: value}) | Q(**{field: value, f'pk__{operator}': pk})
+        ), self.ordering)
+
+    def __getitem__(self, key):
+        return self.queryset[key]
+
+
+class KeysetCursorPagination(CursorPagination):
+    """CursorPagination с позицией из пары (первое поле ordering, pk).
+
+    Позиция из одного поля неуникальна, и DRF обходит равные значения
+    смещением, на котором страница назад сбивается. С pk позиция
+    уникальна, и смещение всегда нулевое. Второе поле ordering — pk:
+    индексы по дате в SQLite внутри равных значений идут по rowid.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return super().paginate_queryset(_Keyset(queryset), request, view)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is not None and cursor.position is not None:
+            value, _, pk = cursor.position.rpartition('|')
+            if parse_datetime(value) is None or not pk.isdigit():
+                raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = super()._get_position_from_instance(instance, ordering)
+        return f'{position}|{instance.pk}'
+
+
+class PostCursorPagination(KeysetCursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-pub_date', '-pk')
+
+
+class CommentCursorPagination(KeysetCursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('created', 'pk')
+
+
+class FeedCursorPagination(KeysetCursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    # Индекс (user, -pub_date) внутри равных дат идёт по возрастанию pk.
+    ordering = ('-pub_date', 'pk')
+
+
+class FollowCursorPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def __init__(self, ordering='user_id'):
+        # Ключ курсора — id второй стороны подписки: по (following, user)
+        # и (user, following) есть индексы.
+        self.ordering = ordering
+
+
+class AsyncKeysetPagination:
+    page_size = 20
+    max_page_size = 100
+    ordering = '-pub_date'
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering=None, page_size=None):
+        self.ordering = ordering or self.ordering
+        self.page_size = page_size or self.page_size
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET.get('page_size', self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position, pk = b64decode(encoded).decode().rsplit('|', 1)
+            position = parse_datetime(position)
+            if position is None:
+                raise ValueError(position)
+            return position, int(pk)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, request, instance):
+        field = self.ordering.lstrip('-')
+        position = f'{getattr(instance, field).isoformat()}|{instance.pk}'
+        return replace_query_param(
+            request.build_absolute_uri(),
+            self.cursor_query_param,
+            b64encode(position.encode()).decode(),
+        )
+
+    def filter_queryset(self, queryset, request):
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        queryset = queryset.order_by(
+            self.ordering, '-pk' if descending else 'pk'
+        )
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            position, pk = cursor
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': position})
+                | Q(**{field: position, f'pk__{lookup}': pk})
+            )
+        return queryset
+
+    async def paginate(self, queryset, request, archived=None):
+        # archived — строки старше любой горячей: читаются, только если
+        # горячих на страницу не хватило.
+        page_size = self.get_page_size(request)
+        queryset = self.filter_queryset(queryset, request)
+        page = [obj async for obj in queryset[:page_size + 1]]
+        if archived is not None and len(page) <= page_size:
+            archived = self.filter_queryset(archived, request)
+            page += [
+                obj async for obj in archived[:page_size + 1 - len(page)]
+            ]
+        next_link = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_link = self.encode_cursor(request, page[-1])
+        return page, next_link
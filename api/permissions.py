@@ -4,3 +4,7 @@ from rest_framework import permissions
 class IsOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return request.method in permissions.SAFE_METHODS or obj.author == request.user
+
+    def has_bulk_permission(self, request, view, queryset):
+        return (request.method in permissions.SAFE_METHODS
+                or not queryset.exclude(author=request.user).exists())
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Q
+
+from . import changes, counters
+from .cache import bump_on_commit
+from .models import ArchivedComment, ArchivedPost, Comment, FeedEntry, \
+    Follow, Group, Post, Profile
+from .scheduler import Worker
+
+
+def _ids(queryset, limit):
+    return list(queryset.order_by().values_list('pk', flat=True)[:limit])
+
+
+# Помеченных строк мало: запросы идут от них по частичным индексам
+# *_deleted, а дочерние строки ищутся по индексам внешних ключей.
+def _deleted(model, field='pk'):
+    return model.all_objects.filter(
+        deleted_at__isnull=False
+    ).values(field)
+
+
+def cascade(limit):
+    """Помечает удалёнными объекты, родитель которых уже помечен."""
+    users = _deleted(Profile, 'user')
+    for queryset in (
+        Post.objects.filter(group__in=_deleted(Group)),
+        Post.objects.filter(author__in=users),
+        Comment.objects.filter(post__in=_deleted(Post)),
+        Comment.objects.filter(author__in=users),
+    ):
+        ids = _ids(queryset, limit)
+        if ids:
+            return queryset.model.objects.filter(pk__in=ids).soft_delete()
+    ids = _ids(Follow.objects.filter(
+        Q(user__in=users) | Q(following__in=users)
+    ), limit)
+    if ids:
+        # Подписки удаляются сразу: сигналы поправят счётчики и ленты.
+        Follow.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+# Архив не проходит мягкое удаление: надгробия для журнала изменений
+# пишутся перед DELETE под типом исходной модели, id у них общие.
+ARCHIVED = {ArchivedPost: Post, ArchivedComment: Comment}
+
+
+def _discount(model, ids):
+    """Архив не помечается удалённым: счётчики правятся перед DELETE."""
+    if model is ArchivedPost:
+        parent, field, counter, tag = Group, 'group', 'post_count', 'groups'
+    elif model is ArchivedComment:
+        parent, field, counter, tag = \
+            ArchivedPost, 'post', 'comment_count', 'posts'
+    else:
+        return
+    totals = model.objects.filter(
+        pk__in=ids, **{f'{field}__isnull': False}
+    ).order_by().values_list(field).annotate(total=Count('pk'))
+    for pk, total in totals:
+        counters.bump(parent, pk, **{counter: -total})
+    bump_on_commit(tag)
+
+
+def purge(limit):
+    """Удаляет помеченные строки, на которые больше ничего не ссылается."""
+    groups, users = _deleted(Group), _deleted(Profile, 'user')
+    for queryset in (
+        # Архив не помечается: его строки удаляются вслед за родителем.
+        ArchivedComment.objects.filter(post__group__in=groups),
+        ArchivedComment.objects.filter(post__author__in=users),
+        ArchivedComment.objects.filter(author__in=users),
+        ArchivedPost.objects.filter(group__in=groups, comments=None),
+        ArchivedPost.objects.filter(author__in=users, comments=None),
+        FeedEntry.objects.filter(post__in=_deleted(Post)),
+        FeedEntry.objects.filter(user__in=users),
+        Comment.all_objects.filter(deleted_at__isnull=False),
+        Post.all_objects.filter(
+            deleted_at__isnull=False, comments=None, feed_entries=None
+        ),
+        Group.all_objects.filter(
+            deleted_at__isnull=False, posts=None, archived_posts=None
+        ),
+    ):
+        ids = _ids(queryset, limit)
+        if ids:
+            # post_delete уже отправлен при мягком удалении, поэтому
+            # строки удаляются одним DELETE без сигналов и каскада.
+            model = queryset.model
+            _discount(model, ids)
+            if model in ARCHIVED:
+                changes.record(ARCHIVED[model], *ids, deleted=True)
+            return model._base_manager.filter(pk__in=ids)._raw_delete(
+                model._base_manager.db
+            )
+    ids = list(Profile.all_objects.filter(
+        deleted_at__isnull=False,
+        user__posts=None,
+        user__comments=None,
+        user__archived_posts=None,
+        user__archived_comments=None,
+        user__follower=None,
+        user__following=None,
+        user__feed=None,
+    ).values_list('user', flat=True)[:limit])
+    if ids:
+        User.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def run(limit):
+    with transaction.atomic():
+        return cascade(limit) or purge(limit)
+
+
+worker = Worker('purge', run, 'PURGE')
+
+
+def schedule():
+    # Без BACKGROUND строки удаляет только команда purge_deleted.
+    if settings.PURGE['BACKGROUND']:
+        transaction.on_commit(worker.wake)
+
+
+def delete(queryset):
+    """Скрывает объекты сразу, а связанные строки удаляет фоном."""
+    count = queryset.soft_delete()
+    schedule()
+    return count
+
+
+def delete_users(queryset):
+    """Запрещает вход сразу, а данные пользователей удаляет фоном."""
+    queryset = User.objects.filter(pk__in=list(
+        queryset.values_list('pk', flat=True)
+    ))
+    with transaction.atomic():
+        for user in queryset.filter(is_active=True):
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+        Profile.all_objects.bulk_create(
+            [Profile(user=user) for user in queryset],
+            ignore_conflicts=True,
+        )
+        count = Profile.objects.filter(user__in=queryset).soft_delete()
+    schedule()
+    return count
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.db import transaction
+
+from . import cache
+from .models import Post
+
+# id последних постов каждой группы в памяти процесса, новые слева.
+# Запись считается верной, пока версия тега group-posts:{id} в общем кэше
+# равна её version: пост в группе из другого процесса меняет версию,
+# и буфер перечитывается одним запросом по индексу (group, pub_date).
+_lock = threading.Lock()
+_buffers = OrderedDict()
+
+
+class _Buffer:
+    def __init__(self, version, ids, complete):
+        self.version = version
+        self.ids = deque(ids, maxlen=settings.GROUP_RECENT_POSTS['SIZE'])
+        # В группе нет постов сверх тех, что лежат в буфере.
+        self.complete = complete
+
+
+def _tag(group_id):
+    return f'group-posts:{group_id}'
+
+
+def _store(group_id, buffer):
+    with _lock:
+        _buffers[group_id] = buffer
+        _buffers.move_to_end(group_id)
+        while len(_buffers) > settings.GROUP_RECENT_POSTS['GROUPS']:
+            _buffers.popitem(last=False)
+
+
+def _load(group_id, version):
+    size = settings.GROUP_RECENT_POSTS['SIZE']
+    ids = list(Post.objects.visible().filter(group=group_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', flat=True)[:size])
+    buffer = _Buffer(version, ids, len(ids) < size)
+    _store(group_id, buffer)
+    return buffer
+
+
+def latest(group_id, count):
+    """id последних count постов группы или None, если буфер мал."""
+    if count > settings.GROUP_RECENT_POSTS['SIZE']:
+        return None
+    version = cache.versions([_tag(group_id)])[0]
+    with _lock:
+        buffer = _buffers.get(group_id)
+    if buffer is None or buffer.version != version:
+        buffer = _load(group_id, version)
+    if len(buffer.ids) < count and not buffer.complete:
+        return None
+    return list(buffer.ids)[:count]
+
+
+def _push(group_id, pk):
+    version = cache.bump(_tag(group_id))[0]
+    with _lock:
+        buffer = _buffers.get(group_id)
+        # Между прошлой версией и этой других записей не было.
+        if buffer is not None and buffer.version == version - 1:
+            if pk not in buffer.ids:
+                buffer.ids.appendleft(pk)
+            buffer.version = version
+            return
+        _buffers.pop(group_id, None)
+
+
+def _invalidate(group_ids):
+    cache.bump(*map(_tag, group_ids))
+    with _lock:
+        for group_id in group_ids:
+            _buffers.pop(group_id, None)
+
+
+def push(group_id, pk):
+    """Новый пост в группе: после коммита добавить его в буфер."""
+    transaction.on_commit(lambda: _push(group_id, pk))
+
+
+def invalidate(*group_ids):
+    # Сразу и после коммита, как bump_on_commit для ответов.
+    _invalidate(group_ids)
+    transaction.on_commit(lambda: _invalidate(group_ids))
@@ -0,0 +1,97 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = 'default'
+
+# По умолчанию всё читается с основной базы: реплики включает только
+# ReplicaMiddleware для безопасных запросов.
+_read_alias = ContextVar('read_alias', default=PRIMARY)
+
+
+def reading_from_replica():
+    return _read_alias.get() != PRIMARY
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def _sticky_key(request):
+    credential = (
+        request.headers.get('Authorization')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credential:
+        return None
+    digest = hashlib.blake2b(credential.encode(), digest_size=16).hexdigest()
+    return f'replica:sticky:{digest}'
+
+
+class ReplicaMiddleware:
+    """Чтение безопасных запросов с реплики, запись — в основную базу.
+
+    После записи запросы с теми же учётными данными ещё
+    REPLICA_STICKY_SECONDS читают с основной базы, чтобы автор сразу
+    видел свои изменения, даже если реплика отстаёт.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cache = caches[settings.API_CACHE_ALIAS]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_alias.set(self.choose(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self.stick(request)
+        return response
+
+    async def __acall__(self, request):
+        token = _read_alias.set(self.choose(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self.stick(request)
+        return response
+
+    def choose(self, request):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or request.method not in SAFE_METHODS:
+            return PRIMARY
+        key = _sticky_key(request)
+        if key is not None and self.cache.get(key):
+            return PRIMARY
+        return random.choice(replicas)
+
+    def stick(self, request):
+        if request.method in SAFE_METHODS or not settings.DATABASE_REPLICAS:
+            return
+        key = _sticky_key(request)
+        if key is not None:
+            self.cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """Фоновый поток, который выполняет job() пачками, пока есть работа.
+
+    job(batch_size) возвращает число обработанных строк; между пачками
+    поток спит PAUSE секунд, чтобы другие писатели успевали взять
+    блокировку. Настройки берутся из словаря settings.<setting>.
+    """
+
+    def __init__(self, name, job, setting):
+        self.name = name
+        self.job = job
+        self.setting = setting
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+        self._next_run = 0
+
+    def wake(self):
+        with self._lock:
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def wake_periodically(self):
+        """После коммита будит поток, но не чаще раза в INTERVAL секунд."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_run:
+                return
+            self._next_run = now + getattr(settings, self.setting)['INTERVAL']
+        transaction.on_commit(self.wake)
+
+    def _run(self):
+        try:
+            while self._take():
+                self.drain()
+        except Exception:
+            logger.exception('Фоновая задача %s упала', self.name)
+            with self._lock:
+                self._thread = None
+        finally:
+            connection.close()
+
+    def _take(self):
+        with self._lock:
+            if not self._pending:
+                self._thread = None
+                return False
+            self._pending = False
+            return True
+
+    def drain(self, batch_size=None, pause=None, **kwargs):
+        """Выполняет job() до пустой пачки и возвращает число строк.
+
+        batch_size и pause заменяют значения из настроек, kwargs
+        передаются в job() — так этот же цикл запускают команды.
+        """
+        total = 0
+        while True:
+            options = getattr(settings, self.setting)
+            done = self.job(batch_size or options['BATCH_SIZE'], **kwargs)
+            if not done:
+                return total
+            total += done
+            time.sleep(options['PAUSE'] if pause is None else pause)
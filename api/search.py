@@ -0,0 +1,163 @@
+import re
+
+from django.db import connection, connections
+
+SEARCH_TABLES = {
+    'posts': 'api_post',
+    'comments': 'api_comment',
+    'archived_posts': 'api_archivedpost',
+    'archived_comments': 'api_archivedcomment',
+}
+# Архив старше горячих таблиц и читается после них, если совпадений
+# не хватило на limit. id при переносе в архив сохраняются.
+TIERS = {
+    'posts': ('posts', 'archived_posts'),
+    'comments': ('comments', 'archived_comments'),
+}
+POST_TABLES = {
+    'api_post': 'api_post',
+    'api_comment': 'api_post',
+    'api_archivedpost': 'api_archivedpost',
+    'api_archivedcomment': 'api_archivedpost',
+}
+
+
+def match_terms(query):
+    return re.findall(r'\w+', query)[:10]
+
+
+class SqliteSearchBackend:
+    def install(self, cursor):
+        for table in SEARCH_TABLES.values():
+            cursor.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+                [table, f'{table}_fts_%'],
+            )
+            if len(cursor.fetchall()) == 3:
+                continue
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                f"text, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai "
+                f"AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {table}_fts(rowid, text) "
+                f"VALUES (new.id, new.text); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad "
+                f"AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {table}_fts({table}_fts, rowid, text) "
+                f"VALUES ('delete', old.id, old.text); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au "
+                f"AFTER UPDATE OF text ON {table} BEGIN "
+                f"INSERT INTO {table}_fts({table}_fts, rowid, text) "
+                f"VALUES ('delete', old.id, old.text); "
+                f"INSERT INTO {table}_fts(rowid, text) "
+                f"VALUES (new.id, new.text); END"
+            )
+            self.rebuild(cursor, table)
+
+    def rebuild(self, cursor, table):
+        cursor.execute(
+            f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"
+        )
+
+    def match_sql(self, table, terms):
+        return (
+            f"JOIN {table}_fts ON {table}_fts.rowid = {table}.id",
+            f"{table}_fts MATCH %s",
+            ' '.join(f'"{term}"*' for term in terms),
+            f"{table}_fts.rank",
+        )
+
+
+class PostgresSearchBackend:
+    def install(self, cursor):
+        for table in SEARCH_TABLES.values():
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_text_tsv ON {table} "
+                f"USING gin (to_tsvector('simple', text))"
+            )
+
+    def rebuild(self, cursor, table):
+        cursor.execute(f"REINDEX INDEX {table}_text_tsv")
+
+    def match_sql(self, table, terms):
+        vector = f"to_tsvector('simple', {table}.text)"
+        query = "to_tsquery('simple', %s)"
+        return (
+            '',
+            f"{vector} @@ {query}",
+            ' & '.join(f'{term}:*' for term in terms),
+            f"ts_rank({vector}, to_tsquery('simple', %s)) DESC",
+        )
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    return BACKENDS[connections[using].vendor]()
+
+
+def install(using='default', **kwargs):
+    if connections[using].vendor in BACKENDS:
+        with connections[using].cursor() as cursor:
+            get_backend(using).install(cursor)
+
+
+def rebuild(using='default'):
+    backend = get_backend(using)
+    with connections[using].cursor() as cursor:
+        for table in SEARCH_TABLES.values():
+            backend.rebuild(cursor, table)
+
+
+def _search_table(table, terms, group, author, limit):
+    join, where, match, order = get_backend().match_sql(table, terms)
+    params = [match]
+    post_table = POST_TABLES[table]
+    if post_table != table:
+        join += f" JOIN {post_table} ON {post_table}.id = {table}.post_id"
+    conditions = [where]
+    if group is not None:
+        conditions.append(f"{post_table}.group_id = %s")
+        params.append(group)
+    if author is not None:
+        join += f" JOIN auth_user ON auth_user.id = {table}.author_id"
+        conditions.append("auth_user.username = %s")
+        params.append(author)
+    if '%s' in order:
+        params.append(match)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {table}.id FROM {table} {join} "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {order} LIMIT %s",
+            params,
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(kind, query, group=None, author=None, limit=20):
+    terms = match_terms(query)
+    if not terms:
+        return []
+    ids = []
+    for name in TIERS.get(kind, (kind,)):
+        ids += _search_table(
+            SEARCH_TABLES[name], terms, group, author, limit - len(ids)
+        )
+        if len(ids) >= limit:
+            break
+    return ids
@@ -1,33 +1,107 @@
+from string import ascii_lowercase
+
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.utils.crypto import get_random_string
+from django.utils.text import slugify
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from .authentication import is_revoked, revoke
+from .metrics import TimedListSerializer, TimedSerializerMixin
 from .models import Post, Comment, Follow, Group
 
 
-class PostSerializer(serializers.ModelSerializer):
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        fields = ('id', 'username', 'first_name', 'last_name')
+        model = User
+
+
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # context['fields'] оставляет только перечисленные поля,
+    # context['expand'] встраивает связанные объекты.
+    expansions = ('author', 'group', 'comments')
+
     author = serializers.SlugRelatedField(
         many=False,
         slug_field='username',
         read_only=True
     )
+    renditions = serializers.SerializerMethodField()
 
     class Meta:
-        fields = ('id', 'text', 'author', 'pub_date')
+        fields = ('id', 'text', 'author', 'pub_date', 'updated',
+                  'comment_count', 'image', 'renditions')
+        read_only_fields = ('comment_count',)
         model = Post
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand', ())
+        for name in expand:
+            self.fields[name] = self.get_expanded_field(name)
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+    def get_expanded_field(self, name):
+        if name == 'author':
+            return AuthorSerializer(read_only=True)
+        if name == 'group':
+            return GroupSerializer(read_only=True)
+        return CommentSerializer(many=True, read_only=True)
+
+    @classmethod
+    def expand_queryset(cls, queryset, expand, prefix='', comments=Comment):
+        # Каждое встраивание — ровно один select_related или prefetch_related.
+        for name in expand:
+            if name == 'comments':
+                # Порядок (post_id, created) идёт по индексу и для списка id
+                # постов, внутри поста комментарии всё так же по дате.
+                queryset = queryset.prefetch_related(Prefetch(
+                    f'{prefix}comments',
+                    queryset=comments.objects.visible().select_related(
+                        'author'
+                    ).order_by('post_id', 'created'),
+                ))
+            else:
+                queryset = queryset.select_related(f'{prefix}{name}')
+        return queryset
+
+    def get_renditions(self, obj):
+        request = self.context.get('request')
+        result = {}
+        for fmt, names in obj.renditions.items():
+            result[fmt] = {}
+            for width, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                result[fmt][width] = url
+        return result
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = serializers.SlugRelatedField(
         slug_field='username',
         read_only=True
     )
+    post = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
-        fields = ('id', 'author', 'post', 'text', 'created')
+        fields = ('id', 'author', 'post', 'text', 'created', 'updated')
         model = Comment
+        list_serializer_class = TimedListSerializer
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         slug_field='username',
         read_only=True,
@@ -41,9 +115,52 @@ class FollowSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('user', 'following')
         model = Follow
+        list_serializer_class = TimedListSerializer
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Помеченная удалённой группа держит свой адрес до purge.
+    slug = serializers.SlugField(
+        max_length=50,
+        required=False,
+        validators=[UniqueValidator(queryset=Group.all_objects.all())],
+    )
+
     class Meta:
-        fields = ('id', 'title')
+        fields = ('id', 'title', 'slug', 'post_count')
+        read_only_fields = ('post_count',)
         model = Group
+        list_serializer_class = TimedListSerializer
+
+    def validate(self, attrs):
+        if self.instance is None and not attrs.get('slug'):
+            base = slugify(attrs['title'])[:40] or 'group'
+            slug = base
+            while Group.all_objects.filter(slug=slug).exists():
+                slug = f'{base}-{get_random_string(6, ascii_lowercase)}'
+            attrs['slug'] = slug
+        return attrs
+
+
+class DenylistTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        try:
+            revoked = is_revoked(RefreshToken(attrs['refresh']))
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        if revoked:
+            raise InvalidToken('Токен отозван')
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+
+    def save(self):
+        revoke(self.validated_data['refresh'])
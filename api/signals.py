@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db.models import DEFERRED
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from . import changes, counters, feed, images, recent, trending
+from .cache import bump_on_commit
+from .models import Post, Comment, Follow, Group, Profile
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Чтение отложенного group_id в .only() стоило бы запроса на строку.
+    instance._saved_group_id = instance.__dict__.get('group_id', DEFERRED)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    # Группу задали объекту, загруженному без неё: старую читаем из базы.
+    if (instance._saved_group_id is DEFERRED
+            and 'group_id' in instance.__dict__):
+        instance._saved_group_id = Post.all_objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    old_group = instance._saved_group_id
+    new_group = instance.__dict__.get('group_id', old_group)
+    if created:
+        old_group = None
+    if old_group != new_group:
+        if old_group is not None:
+            counters.bump(Group, old_group, post_count=-1)
+        if new_group is not None:
+            counters.bump(Group, new_group, post_count=1)
+        changes.record(Group, *filter(None, (old_group, new_group)))
+        bump_on_commit('groups')
+        if created:
+            recent.push(new_group, instance.pk)
+        else:
+            recent.invalidate(*filter(None, (old_group, new_group)))
+    instance._saved_group_id = new_group
+    bump_on_commit('posts', f'post:{instance.pk}')
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    images.discard(instance.pk)
+    if instance.group_id is not None:
+        counters.bump(Group, instance.group_id, post_count=-1)
+        changes.record(Group, instance.group_id)
+        bump_on_commit('groups')
+        recent.invalidate(instance.group_id)
+    bump_on_commit('posts', f'post:{instance.pk}',
+                   'comments', f'comments:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(Post, instance.post_id, comment_count=1)
+        changes.record(Post, instance.post_id)
+        bump_on_commit('posts', f'post:{instance.post_id}')
+    bump_on_commit('comments', f'comments:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump(Post, instance.post_id, comment_count=-1)
+    changes.record(Post, instance.post_id)
+    bump_on_commit('posts', f'post:{instance.post_id}',
+                   'comments', f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump_on_commit('groups')
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Profile)
+def parent_deleted(sender, instance, **kwargs):
+    # Посты и комментарии скрываются сразу (visible), а каскад пометит их
+    # позже: сбрасываем все ответы и буферы групп с постами автора.
+    bump_on_commit('hidden')
+    if sender is Profile:
+        recent.invalidate(*Post.objects.filter(
+            author=instance.user_id, group__isnull=False
+        ).order_by().values_list('group', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Group)
+def trending_deleted(sender, instance, **kwargs):
+    trending.forget(sender, instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_profile(instance.user_id, following_count=1)
+        counters.bump_profile(instance.following_id, follower_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump(Profile, instance.user_id, following_count=-1)
+    counters.bump(Profile, instance.following_id, follower_count=-1)
+    feed.drop(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+    bump_on_commit(f'user:{instance.pk}')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_on_commit(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Follow)
+def tracked_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changes.record(sender, instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Follow)
+def tracked_deleted(sender, instance, **kwargs):
+    changes.record(sender, instance.pk, deleted=True)
+
+
+@contextmanager
+def batched():
+    """Массовые операции пишут журнал и счётчики одним запросом на модель."""
+    with changes.deferred(), counters.deferred():
+        yield
+
+
+def notify_saved(instances, created):
+    for instance in instances:
+        post_save.send(
+            sender=type(instance),
+            instance=instance,
+            created=created,
+            update_fields=None,
+            raw=False,
+            using=instance._state.db,
+        )
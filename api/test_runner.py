@@ -0,0 +1,21 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Счётчики ограничений в тестах хранятся в кэше процесса.
+
+    Файл throttle.sqlite3 переживает прогоны, и за день тесты сами
+    исчерпали бы дневной лимит анонимных запросов.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._throttle_store = override_settings(
+            THROTTLE_STORE={'BACKEND': 'cache'}
+        )
+        self._throttle_store.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._throttle_store.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1685 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+from datetime import timedelta
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, resolve
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework.throttling import SimpleRateThrottle
+
+from benchmarks import loadtest
+
+from . import archive, metrics, purge, scheduler, search, trending
+from .cache import check_shared_cache
+from .models import Post, Comment, Follow, Group, Change, Profile, \
+    FeedEntry, ArchivedPost, ArchivedComment, TrendingScore, TrendingState
+from .routers import ReplicaMiddleware, ReplicaRouter
+from .throttling import SlidingWindowThrottle, SQLiteThrottleStore, \
+    get_store
+from .urls import urlpatterns
+
+
+class QueryCountTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='Пост', author=self.user)
+
+    def add_rows(self, n):
+        for i in range(n):
+            author = User.objects.create_user(
+                username=f'author{Post.objects.count()}'
+            )
+            Post.objects.create(text='Пост', author=author, group=self.group)
+            Comment.objects.create(post=self.post, author=author, text='Ок')
+            Follow.objects.create(user=author, following=self.user)
+            Follow.objects.create(user=self.user, following=author)
+            Group.objects.create(title=author.username, slug=author.username)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(context)
+
+    def assertConstantQueries(self, url):
+        self.add_rows(1)
+        few = self.count_queries(url)
+        self.add_rows(10)
+        many = self.count_queries(url)
+        self.assertEqual(
+            few, many,
+            f'{url}: {few} запросов для 1 строки, {many} для 11'
+        )
+
+    def test_anonymous_endpoints(self):
+        for url in (
+            '/api/v1/posts/',
+            f'/api/v1/posts/?group={self.group.pk}',
+            '/api/v1/posts/?expand=author,group,comments',
+            f'/api/v1/posts/{self.post.pk}/',
+            f'/api/v1/posts/{self.post.pk}/comments/',
+            '/api/v1/group/',
+            '/api/v1/search/?q=пост',
+            '/api/v1/search/?q=ок&type=comments',
+            '/api/v1/changes/',
+            '/api/v1/trending/',
+            '/api/v1/group/group/posts/',
+            '/api/v1/group/group/posts/?expand=author,comments',
+            '/api/v1/follow/followers/?username=reader',
+            '/api/v1/follow/following/?username=reader',
+        ):
+            with self.subTest(url=url):
+                self.assertConstantQueries(url)
+
+    def test_authenticated_endpoints(self):
+        self.client.force_authenticate(self.user)
+        for url in (
+            '/api/v1/follow/',
+            '/api/v1/follow/?search=reader',
+            '/api/v1/follow/mutual/',
+            '/api/v1/follow/check/?username=author0,author1,nobody',
+            '/api/v1/feed/',
+            '/api/v1/feed/?expand=group,comments&fields=id',
+        ):
+            with self.subTest(url=url):
+                self.assertConstantQueries(url)
+
+
+class CursorPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_authenticate(self.user)
+        self.posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+            for number in range(7)
+        ]
+        # Равные даты: порядок страниц не должен от них зависеть.
+        moment = timezone.now() - timedelta(hours=1)
+        Post.objects.filter(
+            pk__in=[post.pk for post in self.posts[2:5]]
+        ).update(pub_date=moment)
+
+    def test_pages_stable_under_inserts(self):
+        expected = list(Post.objects.values_list('pk', flat=True))
+        data = self.client.get('/api/v1/posts/?page_size=2').json()
+        pages = [[post['id'] for post in data['results']]]
+        # Новые посты появляются в начале и не сдвигают следующие страницы.
+        Post.objects.create(text='Новый', author=self.user)
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            pages.append([post['id'] for post in data['results']])
+        self.assertEqual(sum(pages, []), expected)
+
+        data = self.client.get(data['previous']).json()
+        self.assertEqual([post['id'] for post in data['results']], pages[-2])
+
+    def test_comments_in_creation_order(self):
+        post = self.posts[0]
+        comments = [
+            Comment.objects.create(post=post, author=self.user, text=str(n))
+            for n in range(5)
+        ]
+        url = f'/api/v1/posts/{post.pk}/comments/?page_size=2'
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [comment['id'] for comment in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [comment.pk for comment in comments])
+        response = self.client.get(
+            f'/api/v1/posts/{post.pk}/comments/?cursor=bad'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ResponseCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Пост', author=self.user)
+
+    def test_repeated_get_skips_database(self):
+        url = f'/api/v1/posts/{self.post.pk}/'
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(url)
+        self.assertEqual(len(context), 0)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_conditional_get(self):
+        etag = self.client.get('/api/v1/posts/')['ETag']
+        response = self.client.get('/api/v1/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_write_invalidates(self):
+        etag = self.client.get('/api/v1/posts/')['ETag']
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get('/api/v1/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Новый пост')
+
+        url = f'/api/v1/posts/{self.post.pk}/comments/'
+        self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.user, text='Ок')
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+
+
+class PostShapeTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(
+            text='Пост', author=self.user, group=self.group
+        )
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Первый'
+        )
+
+    def test_fields_and_expand(self):
+        url = f'/api/v1/posts/{self.post.pk}/'
+        self.assertEqual(
+            self.client.get(url, {'fields': 'id,pub_date'}).json(),
+            {'id': self.post.pk, 'pub_date': self.client.get(url).json()[
+                'pub_date'
+            ]}
+        )
+        data = self.client.get(
+            url, {'fields': 'id', 'expand': 'author,group,comments'}
+        ).json()
+        self.assertEqual(
+            set(data), {'id', 'author', 'group', 'comments'}
+        )
+        self.assertEqual(data['author']['username'], 'author')
+        self.assertEqual(data['group']['title'], 'Группа')
+        self.assertEqual(data['comments'][0]['text'], 'Первый')
+        response = self.client.get(url, {'expand': 'likes'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_embedded_objects_are_not_served_stale(self):
+        params = {'expand': 'group,comments'}
+        self.client.get('/api/v1/posts/', params)
+        self.client.get(f'/api/v1/posts/{self.post.pk}/', params)
+        self.comment.text = 'Исправлен'
+        self.comment.save()
+        self.group.title = 'Переименована'
+        self.group.save()
+        for url in ('/api/v1/posts/', f'/api/v1/posts/{self.post.pk}/'):
+            data = self.client.get(url, params).json()
+            data = data.get('results', [data])[0]
+            self.assertEqual(data['comments'][0]['text'], 'Исправлен', url)
+            self.assertEqual(data['group']['title'], 'Переименована', url)
+
+
+class GroupPostsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.other = Group.objects.create(title='Другая', slug='other')
+        self.posts = [
+            Post.objects.create(
+                text=str(number), author=self.user, group=self.group
+            )
+            for number in range(5)
+        ]
+        Post.objects.create(text='Чужой', author=self.user, group=self.other)
+        self.client.force_authenticate(self.user)
+
+    def test_slug(self):
+        response = self.client.get('/api/v1/group/')
+        self.assertEqual(response.json()[0]['slug'], 'group')
+        response = self.client.post(
+            '/api/v1/group/', {'title': 'Группа', 'slug': 'group'}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/group/', {'title': 'Group'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['slug'].startswith('group-'))
+        self.assertEqual(
+            self.client.get('/api/v1/group/missing/posts/').status_code, 404
+        )
+        # Посты группы — только список, маршрута detail у них нет.
+        response = self.client.get(
+            f'/api/v1/group/group/posts/{self.posts[0].pk}/'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_first_page_from_buffer(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/group/group/posts/')
+        self.assertEqual(
+            [post['id'] for post in response.json()['results']],
+            [post.pk for post in reversed(self.posts)],
+        )
+        self.assertTrue(any(
+            '"api_post"."id" IN' in query['sql']
+            for query in context.captured_queries
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                text='Новый', author=self.user, group=self.group
+            )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/group/group/posts/')
+        self.assertEqual(response.json()['results'][0]['id'], post.pk)
+        self.assertEqual(len(response.json()['results']), 6)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'LIMIT 200' in query['sql']
+        ])
+
+    def test_pages_after_first(self):
+        seen, url = [], '/api/v1/group/group/posts/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen += [post['id'] for post in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+        self.posts[0].soft_delete()
+        data = self.client.get('/api/v1/group/group/posts/').json()
+        self.assertNotIn(
+            self.posts[0].pk, [post['id'] for post in data['results']]
+        )
+
+
+class BulkTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+        self.other = User.objects.create_user(username='other')
+        self.client.force_authenticate(self.user)
+
+    def test_create_reports_errors_per_item(self):
+        response = self.client.post(
+            '/api/v1/posts/bulk/',
+            [{'text': 'Первый'}, {'text': ''}, {'text': 'Третий'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()), ['1'])
+        self.assertFalse(Post.objects.exists())
+
+        response = self.client.post(
+            '/api/v1/posts/bulk/',
+            [{'text': 'Первый'}, {'text': 'Второй'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 2)
+
+    def test_update_and_delete_check_ownership(self):
+        own = Post.objects.create(text='Свой', author=self.user)
+        alien = Post.objects.create(text='Чужой', author=self.other)
+        response = self.client.delete(
+            '/api/v1/posts/bulk/', [own.pk, alien.pk], format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Post.objects.count(), 2)
+
+        response = self.client.patch(
+            '/api/v1/posts/bulk/', [{'id': own.pk, 'text': 'Новый'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        own.refresh_from_db()
+        self.assertEqual(own.text, 'Новый')
+
+        response = self.client.delete(
+            '/api/v1/posts/bulk/', [own.pk], format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Post.objects.all()), [alien])
+
+    def bulk_queries(self, url, items):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, items, format='json')
+        self.assertEqual(response.status_code, 201)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_journal_written_once_per_model(self):
+        post = Post.objects.create(text='Пост', author=self.user)
+        for url, item in (
+            ('/api/v1/posts/bulk/', {'text': 'Пост'}),
+            (f'/api/v1/posts/{post.pk}/comments/bulk/', {'text': 'Ок'}),
+        ):
+            small, large = (
+                self.bulk_queries(url, [item] * size) for size in (10, 100)
+            )
+            self.assertEqual(len(small), len(large))
+        self.assertEqual(Change.objects.filter(kind='comment').count(), 110)
+        self.assertEqual(
+            Change.objects.last().object_id,
+            Comment.objects.order_by('pk').last().pk,
+        )
+
+
+@override_settings(ARCHIVE={'DAYS': 30, 'BACKGROUND': False, 'INTERVAL': 0,
+                            'BATCH_SIZE': 100, 'PAUSE': 0})
+class ExportTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+            for number in range(6)
+        ]
+        # Два старых поста уходят в архив, у трёх следующих общая дата.
+        now = timezone.now()
+        for days, post in zip((60, 59, 1, 1, 1), self.posts):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - timedelta(days=days)
+            )
+        Comment.objects.create(post=self.posts[0], author=self.user, text='Ок')
+        call_command('archive_posts', pause=0, stdout=StringIO())
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        response = self.client.get('/api/v1/export/', params)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+
+    def test_archive_first_in_date_order(self):
+        self.assertEqual(ArchivedPost.objects.count(), 2)
+        rows = self.export(comments=1)
+        self.assertEqual(
+            [row['id'] for row in rows], [post.pk for post in self.posts]
+        )
+        self.assertEqual(
+            [comment['text'] for comment in rows[0]['comments']], ['Ок']
+        )
+        self.assertEqual(rows[1]['comments'], [])
+        self.assertNotIn('comments', self.export()[0])
+
+    def test_resume_from_watermark(self):
+        rows = self.export()
+        # Обрыв посреди постов с одинаковой датой и на границе архива.
+        for done in (1, 2, 3):
+            last = rows[done - 1]
+            rest = self.export(since=last['pub_date'], after=last['id'])
+            self.assertEqual(rows[:done] + rest, rows)
+
+        post = Post.objects.create(text='Новый', author=self.user)
+        rest = self.export(since=rows[-1]['pub_date'], after=rows[-1]['id'])
+        self.assertEqual([row['id'] for row in rest], [post.pk])
+
+        since = rows[0]['pub_date']
+        for params in ({'since': 'вчера'}, {'since': since, 'after': 'x'}):
+            response = self.client.get('/api/v1/export/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    PURGE={'BACKGROUND': False, 'BATCH_SIZE': 10, 'PAUSE': 0},
+    TRENDING={**settings.TRENDING, 'BACKGROUND': False},
+)
+class CountersTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.other = Group.objects.create(title='Другая', slug='other')
+        self.post = Post.objects.create(
+            text='Пост', author=self.user, group=self.group
+        )
+        self.client.force_authenticate(self.reader)
+
+    def counts(self):
+        groups = {
+            group['slug']: group['post_count']
+            for group in self.client.get('/api/v1/group/').json()
+        }
+        post = self.client.get(f'/api/v1/posts/{self.post.pk}/').json()
+        profiles = Profile.objects.order_by('user__username').values_list(
+            'follower_count', 'following_count'
+        )
+        return groups, post['comment_count'], list(profiles)
+
+    def test_writes_update_counters(self):
+        url = f'/api/v1/posts/{self.post.pk}/comments/'
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = self.client.post(url, {'text': 'Ок'}).json()
+            self.client.post(url, {'text': 'Ещё'})
+            self.client.post('/api/v1/follow/', {'following': 'auth'})
+        self.assertEqual(
+            self.counts(),
+            ({'group': 1, 'other': 0}, 2, [(1, 0), (0, 1)]),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{url}{comment["id"]}/')
+            self.post.group = self.other
+            self.post.save()
+            Follow.objects.get().delete()
+        self.assertEqual(
+            self.counts(),
+            ({'group': 0, 'other': 1}, 1, [(0, 0), (0, 0)]),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.soft_delete()
+        self.assertEqual(Group.objects.get(slug='other').post_count, 0)
+
+    def test_partial_loads_keep_group_tracking(self):
+        Post.objects.create(text='Ещё', author=self.user, group=self.group)
+        with CaptureQueriesContext(connection) as context:
+            posts = list(Post.objects.only('pk', 'pub_date'))
+        self.assertEqual(len(context), 1)
+
+        post = next(post for post in posts if post.pk == self.post.pk)
+        post.group = self.other
+        post.save()
+        post = Post.objects.only('pk', 'text').get(pk=self.post.pk)
+        post.text = 'Правка'
+        post.save()
+        self.assertEqual(
+            dict(Group.objects.values_list('slug', 'post_count')),
+            {'group': 1, 'other': 1},
+        )
+
+    def test_bulk_writes_bump_once_per_parent(self):
+        names = ['author0', 'author1', 'author2']
+        for name in names:
+            User.objects.create_user(username=name)
+        url = f'/api/v1/posts/{self.post.pk}/comments/bulk/'
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(url, [{'text': 'Ок'}] * 5, format='json')
+            self.client.post('/api/v1/follow/bulk/', names, format='json')
+            self.client.delete(
+                '/api/v1/follow/bulk/', names[:2], format='json'
+            )
+        updates = [
+            query['sql'].split(' SET ')[0]
+            for query in context.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        # Пост обновляется один раз, профили — дважды на запрос подписок:
+        # подписки читателя и подписчики авторов.
+        self.assertEqual(
+            updates, ['UPDATE "api_post"'] + ['UPDATE "api_profile"'] * 4
+        )
+        self.assertEqual(
+            self.counts()[1:], (5, [(0, 0), (0, 0), (0, 0), (1, 0), (0, 1)])
+        )
+
+    def test_rebuild_counters(self):
+        Comment.objects.create(post=self.post, author=self.reader, text='Ок')
+        Follow.objects.create(user=self.reader, following=self.user)
+        expected = self.counts()
+        Post.objects.update(comment_count=7)
+        Group.objects.update(post_count=7)
+        Profile.objects.filter(user=self.user).delete()
+        Profile.objects.update(follower_count=7, following_count=7)
+
+        out = StringIO()
+        call_command('rebuild_counters', stdout=out)
+        self.assertIn('Счётчики пересчитаны', out.getvalue())
+        self.assertEqual(self.counts(), expected)
+
+
+@override_settings(ARCHIVE={'DAYS': 30, 'BACKGROUND': False, 'INTERVAL': 0,
+                            'BATCH_SIZE': 100, 'PAUSE': 0})
+class SearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.other = User.objects.create_user(username='other')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.second = Group.objects.create(title='Вторая', slug='second')
+        archived = Post.objects.create(
+            text='hello archive', author=self.user, group=self.second
+        )
+        Post.objects.filter(pk=archived.pk).update(
+            pub_date=timezone.now() - timedelta(days=60)
+        )
+        call_command('archive_posts', pause=0, stdout=StringIO())
+        self.archived = archived.pk
+        self.world, self.triple, self.help = (
+            Post.objects.create(text=text, author=author, group=group)
+            for text, author, group in (
+                ('hello world', self.user, self.group),
+                ('hello hello hello', self.other, self.group),
+                ('help wanted', self.user, self.second),
+            )
+        )
+        Post.objects.create(text='goodbye', author=self.user)
+        self.comment = Comment.objects.create(
+            post=self.world, author=self.other, text='hello there'
+        )
+
+    def found(self, **params):
+        response = self.client.get('/api/v1/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_rank_and_prefix(self):
+        self.assertEqual(
+            self.found(q='hello'),
+            [self.triple.pk, self.world.pk, self.archived],
+        )
+        found = self.found(q='hel')
+        self.assertEqual(
+            sorted(found[:3]),
+            sorted([self.world.pk, self.triple.pk, self.help.pk]),
+        )
+        self.assertEqual(found[3:], [self.archived])
+        self.assertEqual(self.found(q='hello wor'), [self.world.pk])
+        self.assertEqual(
+            self.found(q='hello', type='comments'), [self.comment.pk]
+        )
+
+    def test_filters(self):
+        self.assertEqual(
+            self.found(q='hel', group=self.second.pk),
+            [self.help.pk, self.archived],
+        )
+        self.assertEqual(
+            self.found(q='hello', author='auth'),
+            [self.world.pk, self.archived],
+        )
+        self.assertEqual(
+            self.found(q='hello', author='other', group=self.group.pk),
+            [self.triple.pk],
+        )
+        self.assertEqual(
+            self.found(q='hello', type='comments', author='auth'), []
+        )
+
+    def test_archive_read_only_when_short(self):
+        with CaptureQueriesContext(connection) as context:
+            found = self.found(q='hello', limit=2)
+        self.assertEqual(found, [self.triple.pk, self.world.pk])
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'api_archivedpost' in query['sql']
+        ])
+        self.assertEqual(self.found(q='hello', limit=3)[2:], [self.archived])
+
+    def test_invalid_params(self):
+        for params in (
+            {}, {'q': ''}, {'q': '!!! ?'}, {'q': 'hello', 'type': 'users'},
+            {'q': 'hello', 'group': 'x'}, {'q': 'hello', 'limit': '-1'},
+        ):
+            response = self.client.get('/api/v1/search/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+def image_file(name, size):
+    from PIL import Image
+
+    content = BytesIO()
+    Image.new('RGB', size, 'red').save(content, format='PNG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+
+class ImageRenditionsTest(APITestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = directory.name
+        self.settings_override = self.settings(
+            MEDIA_ROOT=self.media,
+            IMAGE_RENDITIONS={
+                'WIDTHS': (10, 20, 80), 'FORMATS': ('webp', 'jpeg'),
+                'QUALITY': 80, 'WORKERS': 0,
+            },
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_authenticate(self.user)
+
+    def renditions(self, pk):
+        return self.client.get(f'/api/v1/posts/{pk}/').json()['renditions']
+
+    def test_upload_renders_and_replaces(self):
+        response = self.client.post('/api/v1/posts/', {
+            'text': 'Пост', 'image': image_file('first.png', (40, 20)),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()['id']
+        base = f'http://testserver/media/posts/renditions/{pk}/first/'
+        # Ширины больше исходной не создаются.
+        self.assertEqual(self.renditions(pk), {
+            'webp': {'10': f'{base}10.webp', '20': f'{base}20.webp',
+                     '40': f'{base}40.webp'},
+            'jpeg': {'10': f'{base}10.jpg', '20': f'{base}20.jpg',
+                     '40': f'{base}40.jpg'},
+        })
+        first = os.path.join(self.media, f'posts/renditions/{pk}/first')
+        self.assertEqual(len(os.listdir(first)), 6)
+
+        response = self.client.patch(f'/api/v1/posts/{pk}/', {
+            'image': image_file('second.png', (15, 15)),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(self.renditions(pk)['webp']), ['10', '15']
+        )
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(
+            os.listdir(os.path.join(self.media, f'posts/renditions/{pk}')),
+            ['second'],
+        )
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class CachedAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='author', password='secret-pass'
+        )
+        self.tokens = self.client.post(
+            '/api/v1/token/',
+            {'username': 'author', 'password': 'secret-pass'}
+        ).json()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {self.tokens["access"]}'
+        )
+
+    def test_known_token_skips_database(self):
+        self.client.get('/api/v1/group/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/v1/group/', {'title': 'Группа', 'slug': 'group'}
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(
+            [q for q in context.captured_queries if 'auth_user' in q['sql']]
+        )
+
+    def test_deactivation_invalidates(self):
+        self.assertEqual(self.client.get('/api/v1/feed/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/v1/feed/').status_code, 401)
+
+    def test_revoked_refresh_token(self):
+        refresh = {'refresh': self.tokens['refresh']}
+        self.assertEqual(
+            self.client.post('/api/v1/token/refresh/', refresh).status_code,
+            200
+        )
+        self.assertEqual(
+            self.client.post('/api/v1/token/revoke/', refresh).status_code,
+            204
+        )
+        self.assertEqual(
+            self.client.post('/api/v1/token/refresh/', refresh).status_code,
+            401
+        )
+
+    def test_revocation_survives_cache_clear(self):
+        refresh = {'refresh': self.tokens['refresh']}
+        self.client.post('/api/v1/token/revoke/', refresh)
+        cache.clear()
+        self.assertEqual(
+            self.client.post('/api/v1/token/refresh/', refresh).status_code,
+            401
+        )
+
+    def test_shared_cache_is_required(self):
+        errors = check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ['api.E001'])
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        }}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ThrottleTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_endpoint_has_own_rate(self):
+        credentials = {'username': 'nobody', 'password': 'wrong'}
+        codes = {
+            self.client.post('/api/v1/token/', credentials).status_code
+            for _ in range(21)
+        }
+        self.assertEqual(codes, {401, 429})
+        response = self.client.post('/api/v1/token/', credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class SQLiteThrottleStoreTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'throttle.sqlite3')
+        self.settings_override = self.settings(
+            THROTTLE_STORE={'BACKEND': 'sqlite', 'LOCATION': self.location}
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        rates = dict(
+            SimpleRateThrottle.THROTTLE_RATES, token='2/minute',
+            posts='3/minute',
+        )
+        patcher = mock.patch.object(
+            SimpleRateThrottle, 'THROTTLE_RATES', rates
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Начало минутного окна.
+        self.start = 60 * 10 ** 7
+
+    def request_at(self, seconds, url='/api/v1/token/'):
+        with mock.patch.object(
+            SlidingWindowThrottle, 'timer',
+            return_value=self.start + seconds,
+        ):
+            if url == '/api/v1/token/':
+                return self.client.post(
+                    url, {'username': 'nobody', 'password': 'wrong'}
+                )
+            return self.client.get(url)
+
+    def test_stores_share_counts(self):
+        self.assertIsInstance(get_store(), SQLiteThrottleStore)
+        first = SQLiteThrottleStore(self.location)
+        second = SQLiteThrottleStore(self.location)
+        self.assertEqual(first.hit('key', 10, 60), (1, 0))
+        self.assertEqual(second.hit('key', 10, 60), (2, 0))
+        self.assertEqual(first.hit('other', 10, 60), (1, 0))
+        self.assertEqual(second.hit('key', 11, 60), (1, 2))
+
+    def test_window_slides(self):
+        codes = [self.request_at(0).status_code for _ in range(3)]
+        self.assertEqual(codes, [401, 401, 429])
+        response = self.request_at(30)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # Новое окно, но прошлое ещё целиком в скользящей минуте.
+        self.assertEqual(self.request_at(60).status_code, 429)
+        # Половина окна: 1 * 0.5 + 1 запрос из двух.
+        self.assertEqual(self.request_at(150).status_code, 401)
+
+    def test_rates_per_scope(self):
+        codes = [self.request_at(0).status_code for _ in range(3)]
+        self.assertEqual(codes, [401, 401, 429])
+        codes = [
+            self.request_at(0, '/api/v1/posts/').status_code
+            for _ in range(4)
+        ]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        self.assertEqual(self.request_at(0, '/api/v1/group/').status_code, 200)
+
+
+class AsyncViewsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=self.user,
+                group=self.group if number % 2 else None,
+            )
+            for number in range(5)
+        ]
+        self.comment = Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Ок'
+        )
+
+    def collect(self, url):
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [item['id'] for item in data['results']]
+            url = data['next']
+        return seen
+
+    def test_reads(self):
+        newest_first = [post.pk for post in reversed(self.posts)]
+        self.assertEqual(
+            self.collect('/api/v1/async/posts/?page_size=2'), newest_first
+        )
+        self.assertEqual(
+            self.collect(f'/api/v1/async/posts/?group={self.group.pk}'),
+            [self.posts[3].pk, self.posts[1].pk],
+        )
+        post = self.posts[0]
+        response = self.client.get(f'/api/v1/async/posts/{post.pk}/')
+        self.assertEqual(response.json()['text'], post.text)
+        self.assertEqual(
+            self.collect(f'/api/v1/async/posts/{post.pk}/comments/'),
+            [self.comment.pk],
+        )
+        response = self.client.get('/api/v1/async/group/')
+        self.assertEqual(response.json()[0]['slug'], 'group')
+
+    def test_errors(self):
+        self.assertEqual(
+            self.client.get('/api/v1/async/posts/0/').status_code, 404
+        )
+        self.assertEqual(
+            self.client.get('/api/v1/async/posts/?cursor=x').status_code, 404
+        )
+        self.assertEqual(
+            self.client.get('/api/v1/async/posts/?group=x').status_code, 400
+        )
+        self.assertEqual(
+            self.client.post('/api/v1/async/posts/').status_code, 405
+        )
+
+    def test_throttled_like_sync_views(self):
+        rates = dict(SimpleRateThrottle.THROTTLE_RATES, posts='2/minute')
+        with mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', rates):
+            codes = [
+                self.client.get('/api/v1/async/posts/').status_code
+                for _ in range(3)
+            ]
+            self.assertEqual(codes, [200, 200, 429])
+            response = self.client.get(
+                f'/api/v1/async/posts/{self.posts[0].pk}/'
+            )
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(
+                self.client.get('/api/v1/async/group/').status_code, 200
+            )
+
+
+@override_settings(FEED_FANOUT_LIMIT=0, FEED_BACKFILL=2)
+class CelebrityFeedTest(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.a = User.objects.create_user(username='a')
+        self.b = User.objects.create_user(username='b')
+        self.client.force_authenticate(self.reader)
+
+    def feed(self):
+        return sorted(
+            post['id']
+            for post in self.client.get('/api/v1/feed/').json()['results']
+        )
+
+    def post(self, author, days=0):
+        post = Post.objects.create(text='Пост', author=author)
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(days=days)
+        )
+        return post.pk
+
+    def test_new_celebrity_pulled_despite_newer_entries(self):
+        old = self.post(self.b, days=3)
+        Follow.objects.create(user=self.reader, following=self.a)
+        first = self.post(self.a)
+        self.assertEqual(self.feed(), [first])
+        Follow.objects.create(user=self.reader, following=self.b)
+        self.assertEqual(self.feed(), [old, first])
+
+    def test_gap_longer_than_backfill_is_paged(self):
+        Follow.objects.create(user=self.reader, following=self.a)
+        posts = [self.post(self.a, days=10)]
+        self.assertEqual(self.feed(), posts)
+        posts += [self.post(self.a, days=9 - number) for number in range(5)]
+        self.assertEqual(self.feed(), posts)
+        self.assertEqual(FeedEntry.objects.count(), 6)
+
+    @override_settings(FEED_PULL_PAGES=2)
+    def test_long_gap_is_pulled_over_several_requests(self):
+        Follow.objects.create(user=self.reader, following=self.a)
+        posts = [self.post(self.a, days=10)]
+        self.assertEqual(self.feed(), posts)
+        posts += [self.post(self.a, days=9 - number) for number in range(7)]
+        self.assertEqual(self.feed(), posts[:5])
+        self.assertEqual(self.feed(), posts)
+
+
+class FollowGraphTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader')
+        self.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(5)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_follow_and_unfollow(self):
+        names = ['author0', 'author1', 'author2']
+        Follow.objects.create(user=self.user, following=self.authors[0])
+        Post.objects.create(text='Пост', author=self.authors[1])
+        response = self.client.post(
+            '/api/v1/follow/bulk/', names, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(item['following'] for item in response.data),
+            ['author1', 'author2'],
+        )
+        self.assertEqual(
+            Profile.objects.get(user=self.user).following_count, 3
+        )
+        feed = self.client.get('/api/v1/feed/').data['results']
+        self.assertEqual(len(feed), 1)
+
+        response = self.client.post(
+            '/api/v1/follow/bulk/', names, format='json'
+        )
+        self.assertEqual(response.data, [])
+        response = self.client.post(
+            '/api/v1/follow/bulk/', ['author3', 'nobody'], format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.filter(
+            user=self.user, following=self.authors[3]
+        ).exists())
+
+        response = self.client.delete(
+            '/api/v1/follow/bulk/', names[:2], format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            list(Follow.objects.filter(user=self.user).values_list(
+                'following__username', flat=True
+            )),
+            ['author2'],
+        )
+
+    def test_check_is_one_query(self):
+        Follow.objects.create(user=self.user, following=self.authors[1])
+        names = [f'author{number}' for number in range(1000)]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/v1/follow/check/', names, format='json'
+            )
+        self.assertEqual(len(context), 1)
+        self.assertEqual(len(response.data), 1000)
+        self.assertTrue(response.data['author1'])
+        self.assertFalse(response.data['author0'])
+
+    def test_graph_queries(self):
+        for author in self.authors:
+            Follow.objects.create(user=author, following=self.user)
+        for author in self.authors[:2]:
+            Follow.objects.create(user=self.user, following=author)
+        response = self.client.get('/api/v1/follow/mutual/')
+        self.assertEqual(
+            [item['following'] for item in response.data['results']],
+            ['author0', 'author1'],
+        )
+
+        seen, url = [], '/api/v1/follow/followers/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen += [item['user'] for item in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [author.username for author in self.authors])
+        response = self.client.get(
+            '/api/v1/follow/following/?username=author0'
+        )
+        self.assertEqual(
+            [item['following'] for item in response.data['results']],
+            ['reader'],
+        )
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/v1/follow/followers/')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PURGE={'BACKGROUND': False, 'BATCH_SIZE': 2, 'PAUSE': 0})
+class SoftDeleteTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=self.user, group=self.group
+            )
+            for number in range(5)
+        ]
+        Comment.objects.create(
+            post=self.posts[0], author=self.reader, text='Ок'
+        )
+        Follow.objects.create(user=self.reader, following=self.user)
+        self.client.force_authenticate(self.user)
+
+    def purge(self):
+        call_command('purge_deleted', pause=0, stdout=StringIO())
+
+    def test_post_hidden_then_purged(self):
+        post = self.posts[0]
+        response = self.client.delete(f'/api/v1/posts/{post.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(Post.all_objects.filter(pk=post.pk).exists())
+        self.assertEqual(
+            self.client.get(f'/api/v1/posts/{post.pk}/').status_code, 404
+        )
+        response = self.client.get(f'/api/v1/posts/{post.pk}/comments/')
+        self.assertEqual(response.json()['results'], [])
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 4)
+
+        self.purge()
+        self.assertFalse(Post.all_objects.filter(pk=post.pk).exists())
+        self.assertFalse(Comment.all_objects.exists())
+        self.assertEqual(Post.objects.count(), 4)
+
+    def test_post_delete_drops_cached_comments(self):
+        post = self.posts[0]
+        url = f'/api/v1/posts/{post.pk}/comments/'
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+        self.client.delete(f'/api/v1/posts/{post.pk}/')
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+    def test_group_delete_does_not_cascade_inline(self):
+        with CaptureQueriesContext(connection) as context:
+            purge.delete(Group.objects.filter(pk=self.group.pk))
+        self.assertFalse(
+            [q for q in context.captured_queries if 'api_post' in q['sql']]
+        )
+        self.assertEqual(self.client.get('/api/v1/group/').json(), [])
+
+        self.assertEqual(purge.run(2), 2)
+        self.assertEqual(Post.objects.count(), 3)
+        self.purge()
+        self.assertFalse(Group.all_objects.exists())
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(Comment.all_objects.exists())
+
+    def test_user_delete(self):
+        purge.delete_users(User.objects.filter(pk=self.user.pk))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.purge()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(
+            Profile.objects.get(user=self.reader).following_count, 0
+        )
+
+    def test_group_delete_hides_posts_at_once(self):
+        post = self.posts[0]
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(len(self.client.get('/api/v1/posts/').json()[
+            'results'
+        ]), 5)
+        purge.delete(Group.objects.filter(pk=self.group.pk))
+        self.assertEqual(
+            self.client.get('/api/v1/posts/').json()['results'], []
+        )
+        self.assertEqual(
+            self.client.get(f'/api/v1/posts/{post.pk}/').status_code, 404
+        )
+        response = self.client.get(f'/api/v1/posts/{post.pk}/comments/')
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(
+            self.client.get(f'/api/v1/async/posts/{post.pk}/').status_code,
+            404
+        )
+        self.assertEqual(Post.all_objects.filter(
+            deleted_at__isnull=True
+        ).count(), 5)
+
+    def test_user_delete_hides_rows_at_once(self):
+        post = self.posts[0]
+        other = Post.objects.create(text='Чужой', author=self.reader)
+        Comment.objects.create(post=other, author=self.user, text='Ок')
+        self.client.force_authenticate(self.reader)
+        self.client.get(f'/api/v1/posts/{other.pk}/comments/')
+        purge.delete_users(User.objects.filter(pk=self.user.pk))
+        self.assertEqual(
+            [item['id'] for item in self.client.get(
+                '/api/v1/posts/'
+            ).json()['results']],
+            [other.pk],
+        )
+        self.assertEqual(
+            self.client.get(f'/api/v1/posts/{post.pk}/').status_code, 404
+        )
+        response = self.client.get(f'/api/v1/posts/{other.pk}/comments/')
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(
+            self.client.get('/api/v1/group/group/posts/').json()['results'],
+            []
+        )
+        self.assertEqual(self.client.get('/api/v1/follow/').json(), [])
+
+    def test_worker_throttles_batches(self):
+        done = iter([2, 1, 0])
+        worker = scheduler.Worker('test', lambda size: next(done), 'PURGE')
+        self.assertEqual(worker.drain(), 3)
+
+    def test_drain_overrides_settings(self):
+        sizes = []
+        done = iter([2, 0])
+        worker = scheduler.Worker(
+            'test', lambda size, **kwargs: sizes.append((size, kwargs))
+            or next(done), 'PURGE'
+        )
+        self.assertEqual(worker.drain(3, 0, days=1), 2)
+        self.assertEqual(sizes, [(3, {'days': 1})] * 2)
+
+
+@override_settings(
+    ARCHIVE={'DAYS': 30, 'BACKGROUND': False, 'INTERVAL': 0,
+             'BATCH_SIZE': 2, 'PAUSE': 0},
+    PURGE={'BACKGROUND': False, 'BATCH_SIZE': 10, 'PAUSE': 0},
+)
+class ArchiveTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=self.user, group=self.group
+            )
+            for number in range(5)
+        ]
+        # Три первых поста старше 30 дней, самый старый — первый.
+        for number, post in enumerate(self.posts[:3]):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=timezone.now() - timedelta(days=60 - number)
+            )
+        self.comment = Comment.objects.create(
+            post=self.posts[0], author=self.reader, text='Ок'
+        )
+        FeedEntry.objects.create(
+            user=self.reader, post=self.posts[0],
+            pub_date=timezone.now()
+        )
+        self.newest_first = [post.pk for post in reversed(self.posts)]
+        call_command('archive_posts', pause=0, stdout=StringIO())
+        self.client.force_authenticate(self.reader)
+
+    def collect(self, url):
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [post['id'] for post in data['results']]
+            url = data['next']
+        return seen
+
+    def test_old_posts_moved(self):
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(ArchivedPost.objects.count(), 3)
+        self.assertEqual(
+            list(ArchivedComment.objects.values_list('pk', flat=True)),
+            [self.comment.pk],
+        )
+        self.assertFalse(FeedEntry.objects.exists())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 5)
+        self.assertEqual(archive.run(10), 0)
+
+    def test_pages_reach_archive(self):
+        for url in ('/api/v1/posts/', '/api/v1/group/group/posts/'):
+            self.assertEqual(
+                self.collect(f'{url}?page_size=2'), self.newest_first
+            )
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/v1/posts/?page_size=1')
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'api_archivedpost' in query['sql']
+        ])
+
+        data = self.client.get('/api/v1/posts/?page_size=2').json()
+        data = self.client.get(data['next']).json()
+        data = self.client.get(data['previous']).json()
+        self.assertEqual(
+            [post['id'] for post in data['results']], self.newest_first[:2]
+        )
+
+        data = self.client.get(
+            f'/api/v1/posts/?group={self.group.pk}&expand=comments'
+        ).json()
+        self.assertEqual(data['results'][-1]['comments'][0]['text'], 'Ок')
+
+    def test_archived_post_read_only(self):
+        post = self.posts[0]
+        response = self.client.get(f'/api/v1/posts/{post.pk}/')
+        self.assertEqual(response.json()['comment_count'], 1)
+        response = self.client.get(f'/api/v1/posts/{post.pk}/comments/')
+        self.assertEqual(
+            [comment['id'] for comment in response.json()['results']],
+            [self.comment.pk],
+        )
+        response = self.client.post(
+            f'/api/v1/posts/{post.pk}/comments/', {'text': 'Новый'}
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/api/v1/async/posts/{post.pk}/')
+        self.assertEqual(response.json()['id'], post.pk)
+        response = self.client.get('/api/v1/changes/').json()
+        self.assertFalse([
+            change for change in response['results']
+            if change['type'] == 'post' and change['deleted']
+        ])
+        lines = b''.join(
+            self.client.get('/api/v1/export/').streaming_content
+        ).splitlines()
+        self.assertEqual(
+            [json.loads(line)['id'] for line in lines],
+            self.newest_first[::-1],
+        )
+
+    def test_archived_found_by_search(self):
+        response = self.client.get('/api/v1/search/', {'q': 'пост'})
+        self.assertEqual(
+            sorted(post['id'] for post in response.json()['results']),
+            sorted(self.newest_first),
+        )
+        response = self.client.get(
+            '/api/v1/search/', {'q': 'ок', 'type': 'comments'}
+        )
+        self.assertEqual(
+            [comment['id'] for comment in response.json()['results']],
+            [self.comment.pk],
+        )
+        self.assertEqual(
+            sorted(search.search('archived_posts', 'пост')),
+            sorted(post.pk for post in self.posts[:3]),
+        )
+
+    def tombstones(self, kind):
+        return {
+            change['id'] for change in self.client.get(
+                '/api/v1/changes/'
+            ).json()['results']
+            if change['type'] == kind and change['deleted']
+        }
+
+    def test_purged_with_group_and_author(self):
+        purge.delete_users(User.objects.filter(pk=self.reader.pk))
+        purge.run(10)
+        call_command('purge_deleted', pause=0, stdout=StringIO())
+        self.assertFalse(ArchivedComment.objects.exists())
+        self.assertEqual(
+            ArchivedPost.objects.get(pk=self.posts[0].pk).comment_count, 0
+        )
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.tombstones('comment'), {self.comment.pk})
+
+        purge.delete(Group.objects.filter(pk=self.group.pk))
+        call_command('purge_deleted', pause=0, stdout=StringIO())
+        self.assertFalse(ArchivedPost.objects.exists())
+        self.assertFalse(Group.all_objects.exists())
+        self.assertEqual(
+            self.tombstones('post'), {post.pk for post in self.posts}
+        )
+
+
+class TrendingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.groups = [
+            Group.objects.create(title=slug, slug=slug)
+            for slug in ('first', 'second')
+        ]
+        self.posts = [
+            Post.objects.create(text='Пост', author=self.user, group=group)
+            for group in (*self.groups, None)
+        ]
+        for post, count in zip(self.posts, (1, 3, 0)):
+            for _ in range(count):
+                Comment.objects.create(
+                    post=post, author=self.user, text='Ок'
+                )
+        call_command('update_trending', pause=0, stdout=StringIO())
+
+    def get_trending(self, **params):
+        response = self.client.get('/api/v1/trending/', params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            key: [(item['data']['id'], item['score']) for item in items]
+            for key, items in response.json().items()
+        }
+
+    def test_ranking(self):
+        data = self.get_trending()
+        self.assertEqual(
+            [pk for pk, _ in data['posts']],
+            [self.posts[1].pk, self.posts[0].pk],
+        )
+        self.assertAlmostEqual(data['posts'][0][1], 3, places=2)
+        # Вес группы — комментарии и сам пост.
+        self.assertEqual(
+            [pk for pk, _ in data['groups']],
+            [self.groups[1].pk, self.groups[0].pk],
+        )
+        self.assertAlmostEqual(data['groups'][0][1], 4, places=2)
+        self.assertEqual(len(self.get_trending(limit=1)['posts']), 1)
+        self.assertEqual(
+            self.client.get('/api/v1/trending/?limit=x').status_code, 400
+        )
+
+    def test_incremental_update(self):
+        for _ in range(3):
+            Comment.objects.create(
+                post=self.posts[0], author=self.user, text='Ещё'
+            )
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(trending.run(100), 3)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'FROM "api_comment"' in query['sql']
+            and '"api_comment"."id" >' not in query['sql']
+        ])
+        self.assertEqual(trending.run(100), 0)
+        self.assertEqual(
+            self.get_trending()['posts'][0][0], self.posts[0].pk
+        )
+
+    def test_decay_and_prune(self):
+        # Сдвиг точки отсчёта назад — то же, что прошедшее время.
+        TrendingState.objects.update(
+            epoch=F('epoch') - timedelta(hours=12)
+        )
+        self.assertAlmostEqual(
+            self.get_trending()['posts'][0][1], 0.75, places=2
+        )
+        TrendingState.objects.update(
+            epoch=F('epoch') - timedelta(hours=48)
+        )
+        Comment.objects.create(post=self.posts[2], author=self.user, text='!')
+        trending.run(100)
+        self.assertEqual(
+            list(TrendingScore.objects.values_list('kind', 'object_id')),
+            [('post', self.posts[2].pk)],
+        )
+
+    def test_deleted_post_dropped(self):
+        self.posts[1].soft_delete()
+        self.assertEqual(
+            [pk for pk, _ in self.get_trending()['posts']],
+            [self.posts[0].pk],
+        )
+
+
+class ChangesTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_authenticate(self.user)
+
+    def changes(self, since=0, **params):
+        response = self.client.get(
+            '/api/v1/changes/', {'since': since, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since_cursor(self):
+        group = Group.objects.create(title='Группа', slug='g')
+        since = self.changes()['next']
+        self.assertEqual(self.changes(since)['results'], [])
+
+        post = Post.objects.create(text='Пост', author=self.user, group=group)
+        self.client.post(f'/api/v1/posts/{post.pk}/comments/', {'text': 'к'})
+        data = self.changes(since)
+        types = [(item['type'], item['id']) for item in data['results']]
+        comment = Comment.objects.get()
+        self.assertEqual(sorted(types), sorted([
+            ('group', group.pk), ('post', post.pk), ('comment', comment.pk),
+        ]))
+        # Одна строка журнала на объект, сколько бы раз он ни менялся.
+        self.assertEqual(Change.objects.filter(kind='post').count(), 1)
+        posted = next(i for i in data['results'] if i['type'] == 'post')
+        self.assertEqual(posted['data']['comment_count'], 1)
+
+        since = data['next']
+        self.client.delete(f'/api/v1/posts/{post.pk}/')
+        # Комментарии удалённого поста помечает фоновый purge.
+        purge.run(settings.PURGE['BATCH_SIZE'])
+        results = self.changes(since)['results']
+        self.assertIn(
+            {'type': 'post', 'id': post.pk, 'deleted': True, 'data': None},
+            results,
+        )
+        self.assertIn(
+            {'type': 'comment', 'id': comment.pk, 'deleted': True,
+             'data': None},
+            results,
+        )
+
+    def test_changes_paging(self):
+        Post.objects.bulk_create([
+            Post(text=str(number), author=self.user) for number in range(5)
+        ])
+        for post in Post.objects.all():
+            post.save()
+        data = self.changes(limit=2)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(data['results']), 2)
+        seen = [item['id'] for item in data['results']]
+        while data['has_more']:
+            data = self.changes(data['next'], limit=2)
+            seen += [item['id'] for item in data['results']]
+        self.assertEqual(
+            sorted(seen),
+            sorted(Post.objects.values_list('pk', flat=True)),
+        )
+        response = self.client.get('/api/v1/changes/', {'since': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_record_of_same_object(self):
+        post = Post.objects.create(text='Пост', author=self.user)
+        insert = Change.objects.bulk_create
+        raced = []
+
+        def racing_insert(objs, **kwargs):
+            # Параллельный запрос вставляет ту же строку между нашими
+            # DELETE и INSERT.
+            if not raced:
+                raced.append(True)
+                insert([Change(kind='post', object_id=post.pk)])
+            return insert(objs, **kwargs)
+
+        with mock.patch.object(
+            Change.objects, 'bulk_create', side_effect=racing_insert
+        ):
+            response = self.client.post(
+                f'/api/v1/posts/{post.pk}/comments/', {'text': 'к'}
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(raced)
+        self.assertEqual(
+            Change.objects.filter(kind='post', object_id=post.pk).count(), 1
+        )
+        self.assertEqual(Change.objects.last().kind, 'comment')
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class SeedCommandTest(APITestCase):
+    def test_seed_creates_consistent_data(self):
+        call_command('seed', posts=200, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 400)
+        self.assertFalse(Follow.objects.filter(user=F('following')).exists())
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comments.count())
+        self.assertEqual(Change.objects.filter(kind='post').count(), 200)
+        response = self.client.post(
+            '/api/v1/token/', {'username': 'bench0', 'password': 'bench'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+def url_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_names(pattern.url_patterns)
+        else:
+            yield pattern.name
+
+
+class LoadTestRoutesTest(APITestCase):
+    def test_every_route_is_driven(self):
+        ctx = {
+            'username': 'bench0', 'password': 'bench', 'users': 20,
+            'refresh': '', 'revoked': '', 'posts': [1], 'groups': [1],
+            'slugs': ['group'], 'comment': (1, 1), 'since': '2020-01-01',
+            'created': [1], 'mine': 1,
+        }
+        driven = {
+            resolve(urlsplit(route.build(ctx)[1]).path).url_name
+            for route in loadtest.ROUTES.values()
+        }
+        self.assertEqual(driven, set(url_names(urlpatterns)) - {'api-root'})
+
+
+class MetricsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for histogram in metrics.HISTOGRAMS:
+            histogram.clear()
+        self.user = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост', author=self.user)
+
+    def test_request_is_recorded_per_view_and_action(self):
+        self.client.get('/api/v1/posts/')
+        body = self.client.get('/metrics').content.decode()
+        labels = 'view="post-list",action="list"'
+        self.assertIn(f'api_db_queries_count{{{labels}}} 1', body)
+        self.assertIn(
+            f'api_request_duration_seconds_count{{{labels},status="2xx"}} 1',
+            body
+        )
+        self.assertRegex(
+            body, rf'api_db_queries_sum{{{labels}}} [1-9]'
+        )
+        self.assertRegex(
+            body, rf'api_serialize_duration_seconds_sum{{{labels}}} 0\.0*[1-9]'
+        )
+
+    def test_slow_requests_are_profiled(self):
+        with TemporaryDirectory() as directory:
+            for fmt in ('prof', 'folded'):
+                options = dict(
+                    settings.METRICS, PROFILE_SAMPLE_RATE=1,
+                    PROFILE_THRESHOLD=0, PROFILE_FORMAT=fmt,
+                    PROFILE_DIR=directory,
+                )
+                with self.settings(METRICS=options):
+                    self.client_class().get('/api/v1/posts/')
+            names = sorted(os.listdir(directory))
+            self.assertEqual(len(names), 2)
+            self.assertTrue(names[0].startswith('post-list.list.'))
+            self.assertEqual(
+                {name.rsplit('.', 1)[1] for name in names}, {'folded', 'prof'}
+            )
+
+
+class ExplainQueriesTest(APITestCase):
+    def test_list_endpoints_use_indexes(self):
+        call_command('explain_queries', stdout=StringIO())
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRoutingTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, method, **headers):
+        seen = []
+
+        def view(request):
+            seen.append(ReplicaRouter().db_for_read(Post))
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(
+            getattr(self.factory, method)('/api/v1/posts/', headers=headers)
+        )
+        return seen[0]
+
+    def test_reads_go_to_replica_until_a_write(self):
+        author = {'Authorization': 'Bearer author'}
+        self.assertEqual(self.route('get', **author), 'replica0')
+        self.assertEqual(self.route('post', **author), 'default')
+        self.assertEqual(self.route('get', **author), 'default')
+        self.assertEqual(
+            self.route('get', Authorization='Bearer reader'), 'replica0'
+        )
+        self.assertEqual(ReplicaRouter().db_for_read(Post), 'default')
+
+
+class CompressionTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text='Длинный текст поста. ' * 50, author=user)
+            for _ in range(20)
+        )
+
+    def test_large_responses_are_compressed(self):
+        plain = self.client.get('/api/v1/posts/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        response = self.client.get(
+            '/api/v1/posts/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertLess(len(response.content), len(plain.content) // 5)
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(
+            '/api/v1/group/', HTTP_ACCEPT_ENCODING='gzip, br'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming_export_is_compressed(self):
+        self.client.force_authenticate(User.objects.get())
+        response = self.client.get(
+            '/api/v1/export/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(
+            b''.join(response.streaming_content)
+        ).splitlines()
+        self.assertEqual(len(lines), 20)
+        self.assertEqual(json.loads(lines[0])['author'], 'author')
+
+    def test_invalid_json_body(self):
+        self.client.force_authenticate(User.objects.get())
+        response = self.client.post(
+            '/api/v1/posts/', '{"text":', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,146 @@
+import random
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import (
+    AnonRateThrottle,
+    ScopedRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
+
+
+class SQLiteThrottleStore:
+    def __init__(self, location, **kwargs):
+        self.location = location
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS throttle ('
+                'key TEXT NOT NULL, window INTEGER NOT NULL, '
+                'hits INTEGER NOT NULL, PRIMARY KEY (key, window)'
+                ') WITHOUT ROWID'
+            )
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key, window, duration):
+        connection = self.connection
+        hits = connection.execute(
+            'INSERT INTO throttle (key, window, hits) VALUES (?, ?, 1) '
+            'ON CONFLICT (key, window) DO UPDATE SET hits = hits + 1 '
+            'RETURNING hits',
+            (key, window),
+        ).fetchone()[0]
+        row = connection.execute(
+            'SELECT hits FROM throttle WHERE key = ? AND window = ?',
+            (key, window - 1),
+        ).fetchone()
+        if random.random() < 0.001:
+            connection.execute(
+                'DELETE FROM throttle WHERE window < ?', (window - 1,)
+            )
+        return hits, row[0] if row else 0
+
+
+class CacheThrottleStore:
+    def __init__(self, alias='default', **kwargs):
+        self.cache = caches[alias]
+
+    def hit(self, key, window, duration):
+        current = f'throttle:{key}:{window}'
+        self.cache.add(current, 0, duration * 2)
+        try:
+            hits = self.cache.incr(current)
+        except ValueError:
+            self.cache.set(current, 1, duration * 2)
+            hits = 1
+        return hits, self.cache.get(f'throttle:{key}:{window - 1}', 0)
+
+
+STORES = {
+    'sqlite': SQLiteThrottleStore,
+    'cache': CacheThrottleStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            options = dict(settings.THROTTLE_STORE)
+            _store = STORES[options.pop('BACKEND')](
+                **{name.lower(): value for name, value in options.items()}
+            )
+    return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE':
+        _store = None
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """Скользящее окно из двух счётчиков в общем для всех процессов хранилище.
+
+    Оценка числа запросов за последние duration секунд:
+    hits_prev * (1 - доля прошедшего окна) + hits_current.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        self.elapsed = offset / self.duration
+        hits, previous = get_store().hit(
+            self.key, int(window), self.duration
+        )
+        return previous * (1 - self.elapsed) + hits <= self.num_requests
+
+    def wait(self):
+        return self.duration * (1 - self.elapsed)
+
+
+class UserSlidingThrottle(SlidingWindowThrottle, UserRateThrottle):
+    pass
+
+
+class AnonSlidingThrottle(SlidingWindowThrottle, AnonRateThrottle):
+    pass
+
+
+class ScopedSlidingThrottle(ScopedRateThrottle, SlidingWindowThrottle):
+    pass
+
+
+class WriteSlidingThrottle(SlidingWindowThrottle, UserRateThrottle):
+    scope = 'write'
+
+    def get_cache_key(self, request, view):
+        if request.method in SAFE_METHODS:
+            return None
+        return super().get_cache_key(request, view)
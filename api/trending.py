@@ -0,0 +1,165 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import Comment, Post, TrendingScore, TrendingState
+from .scheduler import Worker
+
+# Веса растут как 2 ** (возраст epoch / HALF_LIFE); задолго до предела
+# float (2 ** 1024) все веса делятся на общий множитель, а epoch
+# переносится на текущий момент.
+REBASE_HALF_LIVES = 512
+
+
+def _exponent(moment, epoch):
+    return (moment - epoch).total_seconds() / settings.TRENDING['HALF_LIFE']
+
+
+def _horizon(now):
+    # Событие старше этого момента весит меньше MIN_SCORE.
+    options = settings.TRENDING
+    return now - timedelta(seconds=options['HALF_LIFE'] * math.log2(
+        1 / options['MIN_SCORE']
+    ))
+
+
+def _last_before(model, field, moment):
+    """Наибольший id строки старше moment: id растут вместе с датой."""
+    rows = model._base_manager.order_by('pk')
+    low = 0
+    high = rows.aggregate(last=Max('pk'))['last'] or 0
+    while low < high:
+        mid = (low + high + 1) // 2
+        pk, created = rows.filter(pk__gte=mid).values_list('pk', field)[0]
+        if created >= moment:
+            high = mid - 1
+        else:
+            low = min(pk, high)
+    return low
+
+
+def _state():
+    try:
+        return TrendingState.objects.get(pk=1)
+    except TrendingState.DoesNotExist:
+        # Первый запуск не перебирает историю, вес которой уже затух.
+        horizon = _horizon(timezone.now())
+        return TrendingState.objects.get_or_create(pk=1, defaults={
+            'last_comment': _last_before(Comment, 'created', horizon),
+            'last_post': _last_before(Post, 'pub_date', horizon),
+        })[0]
+
+
+def _add(deltas):
+    by_kind = defaultdict(list)
+    for kind, pk in deltas:
+        by_kind[kind].append(pk)
+    existing = {}
+    for kind, ids in by_kind.items():
+        for row in TrendingScore.objects.filter(
+            kind=kind, object_id__in=ids
+        ):
+            row.score += deltas[kind, row.object_id]
+            existing[kind, row.object_id] = row
+    TrendingScore.objects.bulk_update(
+        existing.values(), ['score'], batch_size=500
+    )
+    TrendingScore.objects.bulk_create([
+        TrendingScore(kind=kind, object_id=pk, score=delta)
+        for (kind, pk), delta in deltas.items()
+        if (kind, pk) not in existing
+    ], batch_size=500)
+
+
+def run(limit):
+    """Добавляет к весам до limit новых комментариев и постов."""
+    options = settings.TRENDING
+    with transaction.atomic():
+        state = _state()
+        comments = list(Comment.objects.filter(
+            pk__gt=state.last_comment
+        ).order_by('pk').values_list(
+            'pk', 'post_id', 'post__group_id', 'created'
+        )[:limit])
+        posts = list(Post.objects.filter(
+            pk__gt=state.last_post
+        ).order_by('pk').values_list('pk', 'group_id', 'pub_date')[:limit])
+
+        now = timezone.now()
+        epoch = state.epoch
+        if _exponent(now, epoch) > REBASE_HALF_LIVES:
+            epoch = now
+        # Пачку забирает тот процесс, чей UPDATE сработал первым.
+        if not TrendingState.objects.filter(
+            pk=state.pk,
+            epoch=state.epoch,
+            last_comment=state.last_comment,
+            last_post=state.last_post,
+        ).update(
+            epoch=epoch,
+            last_comment=comments[-1][0] if comments else state.last_comment,
+            last_post=posts[-1][0] if posts else state.last_post,
+        ):
+            return 0
+        if epoch != state.epoch:
+            TrendingScore.objects.update(
+                score=F('score') * 2 ** -_exponent(epoch, state.epoch)
+            )
+
+        threshold = options['MIN_SCORE'] * 2 ** _exponent(now, epoch)
+        deltas = defaultdict(float)
+        for _, post_id, group_id, created in comments:
+            weight = 2 ** _exponent(created, epoch)
+            if weight >= threshold:
+                deltas['post', post_id] += weight
+                if group_id is not None:
+                    deltas['group', group_id] += weight
+        for _, group_id, pub_date in posts:
+            weight = options['POST_WEIGHT'] * 2 ** _exponent(pub_date, epoch)
+            if group_id is not None and weight >= threshold:
+                deltas['group', group_id] += weight
+        _add(deltas)
+        # Затухшие строки удаляются, таблица держит только активное.
+        TrendingScore.objects.filter(
+            kind__in=('post', 'group'), score__lt=threshold
+        ).delete()
+    return len(comments) + len(posts)
+
+
+worker = Worker('trending', run, 'TRENDING')
+
+
+def schedule():
+    if settings.TRENDING['BACKGROUND']:
+        worker.wake_periodically()
+
+
+def top(limit, *models):
+    """По каждой модели до limit пар (id, вес сейчас) по убыванию веса."""
+    epoch = TrendingState.objects.filter(pk=1).values_list(
+        'epoch', flat=True
+    ).first()
+    if epoch is None:
+        # Фоновый поток ещё ни разу не запускался.
+        return {model: [] for model in models}
+    scale = 2 ** -_exponent(timezone.now(), epoch)
+    return {
+        model: [
+            (pk, score * scale)
+            for pk, score in TrendingScore.objects.filter(
+                kind=model._meta.model_name
+            ).order_by('-score').values_list('object_id', 'score')[:limit]
+        ]
+        for model in models
+    }
+
+
+def forget(model, pk):
+    TrendingScore.objects.filter(
+        kind=model._meta.model_name, object_id=pk
+    ).delete()
@@ -1,20 +1,44 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
 
-from .views import PostViewSet, FollowViewSet, GroupViewSet, CommentViewSet
+from . import async_views
+from .views import PostViewSet, FollowViewSet, GroupViewSet, CommentViewSet, \
+    GroupPostViewSet, FeedViewSet, ExportView, SearchView, ChangesView, \
+    TrendingView, TokenObtainPairView, TokenRefreshView, TokenRevokeView
 
 router_post = DefaultRouter()
 router_post.register(r'posts', PostViewSet)
 router_post.register(r'follow', FollowViewSet)
 router_post.register(r'group', GroupViewSet)
 router_post.register(r'posts/(?P<post_id>[^/.]+)/comments', CommentViewSet)
+router_post.register(r'feed', FeedViewSet, basename='feed')
+
+async_urlpatterns = [
+    path('posts/', async_views.post_list, name='async_post_list'),
+    path('posts/<int:pk>/', async_views.post_detail, name='async_post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        async_views.comment_list,
+        name='async_comment_list'
+    ),
+    path('group/', async_views.group_list, name='async_group_list'),
+]
 
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
+    # Только список: через роутер CachedResponseMixin.retrieve добавил бы
+    # маршрут detail, которого у постов группы нет.
+    re_path(
+        r'^group/(?P<slug>[-\w]+)/posts/$',
+        GroupPostViewSet.as_view({'get': 'list'}),
+        name='group-posts-list'
+    ),
     path('', include(router_post.urls)),
+    path('export/', ExportView.as_view(), name='export'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('changes/', ChangesView.as_view(), name='changes'),
+    path('trending/', TrendingView.as_view(), name='trending'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
 ]
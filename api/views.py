@@ -1,53 +1,602 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticated, \
+    IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt import views as jwt_views
 
-from .models import Post, Comment, Follow, Group
+from . import archive, feed, images, purge, recent, search, trending
+from .bulk import BulkModelMixin
+from .cache import CachedResponseMixin
+from .models import Post, Comment, Follow, Group, FeedEntry, Change, \
+    ArchivedPost, ArchivedComment, visible_q
+from .pagination import PostCursorPagination, CommentCursorPagination, \
+    FeedCursorPagination, FollowCursorPagination
 from .permissions import IsOwnerOrReadOnly
+from .renderers import FastJSONRenderer
 from .serializers import PostSerializer, CommentSerializer, FollowSerializer, \
-    GroupSerializer
+    GroupSerializer, DenylistTokenRefreshSerializer, TokenRevokeSerializer
+from .signals import batched, notify_saved
+
+
+class PostShapeMixin:
+    def parse_list(self, param, allowed):
+        values = [
+            value.strip()
+            for value in self.request.query_params.get(param, '').split(',')
+            if value.strip()
+        ]
+        unknown = set(values) - set(allowed)
+        if unknown:
+            raise ValidationError({param: [
+                f'Неизвестные значения: {", ".join(sorted(unknown))}.'
+            ]})
+        return tuple(dict.fromkeys(values))
+
+    def get_shape(self):
+        if not hasattr(self, '_shape'):
+            expansions = PostSerializer.expansions
+            self._shape = (
+                self.parse_list(
+                    'fields', PostSerializer.Meta.fields + expansions
+                ),
+                self.parse_list('expand', expansions),
+            )
+        return self._shape
+
+    def expand_queryset(self, queryset, prefix='', comments=Comment):
+        return PostSerializer.expand_queryset(
+            queryset, self.get_shape()[1], prefix, comments
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_shape()
+        return context
+
+
+class ArchiveMixin:
+    """Объект, которого нет в горячей таблице, ищется в архиве."""
+    archived_model = None
+
+    def get_archived_queryset(self):
+        return self.archived_model.objects.visible().select_related('author')
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            instance = get_object_or_404(
+                self.get_archived_queryset(), pk=self.kwargs['pk']
+            )
+            return Response(self.get_serializer(instance).data)
 
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+class ArchivedPostsMixin(ArchiveMixin):
+    archived_model = ArchivedPost
+
+    def get_archived_queryset(self):
+        return self.expand_queryset(
+            super().get_archived_queryset(), comments=ArchivedComment
+        )
+
+    def paginate_queryset(self, queryset):
+        # Курсор, ушедший за самый старый горячий пост, читает архив.
+        if archive.has_posts():
+            queryset = archive.Tiered(
+                queryset, self.filter_queryset(self.get_archived_queryset())
+            )
+        return super().paginate_queryset(queryset)
+
+
+class PostViewSet(BulkModelMixin, CachedResponseMixin, PostShapeMixin,
+                  ArchivedPostsMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.visible().select_related('author')
     serializer_class = PostSerializer
     permission_classes = [IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly]
+    pagination_class = PostCursorPagination
+    throttle_scope = 'posts'
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['group', ]
 
+    def get_queryset(self):
+        return self.expand_queryset(super().get_queryset())
+
+    def get_cache_tags(self):
+        pk = self.kwargs.get('pk')
+        tags = [f'post:{pk}' if pk else 'posts']
+        expand = self.get_shape()[1]
+        if 'group' in expand:
+            tags.append('groups')
+        if 'comments' in expand:
+            tags.append(f'comments:{pk}' if pk else 'comments')
+        return tags
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        images.schedule(post)
+        feed.fan_out(post)
+        archive.schedule()
+        trending.schedule()
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        if 'image' in serializer.validated_data:
+            images.schedule(post)
+
+    def perform_destroy(self, instance):
+        purge.delete(Post.objects.filter(pk=instance.pk))
+
+    def after_bulk_create(self, instances):
+        feed.fan_out(*instances)
+        archive.schedule()
+        trending.schedule()
 
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+class CommentViewSet(BulkModelMixin, CachedResponseMixin, ArchiveMixin,
+                     viewsets.ModelViewSet):
+    queryset = Comment.objects.visible().select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly]
+    pagination_class = CommentCursorPagination
+    archived_model = ArchivedComment
 
     def get_queryset(self):
         return self.queryset.filter(post=self.kwargs.get('post_id'))
 
+    def get_archived_queryset(self):
+        return super().get_archived_queryset().filter(
+            post=self.kwargs.get('post_id')
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if not page and archive.has_posts():
+            # Комментарии архивного поста целиком лежат в архиве.
+            page = super().paginate_queryset(self.get_archived_queryset())
+        return page
+
+    def get_cache_tags(self):
+        return [f'comments:{self.kwargs.get("post_id")}']
+
+    def get_post(self):
+        return get_object_or_404(
+            Post.objects.visible(), pk=self.kwargs.get('post_id')
+        )
+
+    def get_bulk_save_kwargs(self):
+        return {'author': self.request.user, 'post': self.get_post()}
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        serializer.save(author=self.request.user, post=self.get_post())
+        trending.schedule()
 
+    def after_bulk_create(self, instances):
+        trending.schedule()
 
-class FollowViewSet(viewsets.ModelViewSet):
-    queryset = Follow.objects.all()
+    def perform_destroy(self, instance):
+        purge.delete(Comment.objects.filter(pk=instance.pk))
+
+
+class FollowViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                    mixins.CreateModelMixin, viewsets.GenericViewSet):
+    queryset = Follow.objects.visible().select_related('user', 'following')
     serializer_class = FollowSerializer
     permission_classes = [IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly]
-    http_method_names = ['get', 'post']
+    http_method_names = ['get', 'post', 'delete']
     filter_backends = [SearchFilter]
     search_fields = ['=user__username', '=following__username']
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        follow = serializer.save(user=self.request.user)
+        feed.backfill(follow)
+
+    def get_usernames(self, request):
+        if request.method == 'GET':
+            names = request.query_params.get('username', '').split(',')
+        else:
+            names = request.data
+            if not isinstance(names, list) or not all(
+                isinstance(name, str) for name in names
+            ):
+                raise ValidationError('Ожидается список username.')
+        names = list(dict.fromkeys(
+            name.strip() for name in names if name.strip()
+        ))
+        if len(names) > settings.BULK_MAX_ITEMS:
+            raise ValidationError(
+                f'Не больше {settings.BULK_MAX_ITEMS} объектов за запрос.'
+            )
+        return names
+
+    def get_side_filter(self, side):
+        username = self.request.query_params.get('username')
+        if username:
+            return {f'{side}__username': username}
+        if self.request.user.is_authenticated:
+            return {side: self.request.user}
+        raise ValidationError({'username': ['Обязательное поле.']})
 
+    def paginate_follows(self, queryset, ordering):
+        paginator = FollowCursorPagination(ordering)
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        return paginator.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
 
-class GroupViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        names = self.get_usernames(request)
+        users = dict(User.objects.filter(
+            username__in=names
+        ).values_list('username', 'pk'))
+        unknown = [name for name in names if name not in users]
+        if unknown:
+            raise ValidationError({'following': [
+                f'Пользователи не найдены: {", ".join(unknown)}.'
+            ]})
+        ids = set(users.values())
+        follows = Follow.objects.filter(user=request.user, following__in=ids)
+
+        if request.method == 'DELETE':
+            with transaction.atomic(), batched():
+                follows.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.user.pk in ids:
+            raise ValidationError({'following': [
+                'Нельзя подписаться на самого себя.'
+            ]})
+        with transaction.atomic(), batched():
+            ids -= set(follows.values_list('following_id', flat=True))
+            # Гонку с параллельной подпиской решает unique_together.
+            Follow.objects.bulk_create(
+                [Follow(user=request.user, following_id=pk) for pk in ids],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            created = list(self.get_queryset().filter(
+                user=request.user, following__in=ids
+            ))
+            notify_saved(created, created=True)
+        feed.backfill(*created)
+        return Response(
+            self.get_serializer(created, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get', 'post'],
+            permission_classes=[IsAuthenticated])
+    def check(self, request):
+        names = self.get_usernames(request)
+        followed = set(Follow.objects.filter(
+            user=request.user, following__username__in=names
+        ).order_by().values_list('following__username', flat=True))
+        return Response({name: name in followed for name in names})
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def mutual(self, request):
+        return self.paginate_follows(self.get_queryset().filter(
+            user=request.user, following__follower__following=request.user
+        ), 'following_id')
+
+    @action(detail=False)
+    def followers(self, request):
+        return self.paginate_follows(self.get_queryset().filter(
+            **self.get_side_filter('following')
+        ), 'user_id')
+
+    @action(detail=False)
+    def following(self, request):
+        return self.paginate_follows(self.get_queryset().filter(
+            **self.get_side_filter('user')
+        ), 'following_id')
+
+
+class GroupViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     permission_classes = [IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post']
 
+    def get_cache_tags(self):
+        return ['groups']
+
+
+class GroupPostViewSet(CachedResponseMixin, PostShapeMixin,
+                       ArchivedPostsMixin, mixins.ListModelMixin,
+                       viewsets.GenericViewSet):
+    serializer_class = PostSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = PostCursorPagination
+
+    def get_group(self):
+        if not hasattr(self, '_group'):
+            self._group = get_object_or_404(Group, slug=self.kwargs['slug'])
+        return self._group
+
+    def get_cache_tags(self):
+        tags = ['posts', 'groups']
+        if 'comments' in self.get_shape()[1]:
+            tags.append('comments')
+        return tags
+
+    def get_queryset(self):
+        group = self.get_group()
+        queryset = Post.objects.visible().select_related('author').filter(
+            group=group
+        )
+        paginator = self.paginator
+        if paginator.cursor_query_param not in self.request.query_params:
+            ids = recent.latest(
+                group.pk, paginator.get_page_size(self.request) + 1
+            )
+            if ids is not None:
+                # Первая страница собирается по первичному ключу из буфера,
+                # дальше курсор идёт по индексу (group, pub_date).
+                queryset = queryset.filter(pk__in=ids)
+        return self.expand_queryset(queryset)
+
+    def get_archived_queryset(self):
+        return super().get_archived_queryset().filter(group=self.get_group())
+
+
+class FeedViewSet(PostShapeMixin, mixins.ListModelMixin,
+                  viewsets.GenericViewSet):
+    serializer_class = PostSerializer
+    pagination_class = FeedCursorPagination
+
+    def get_queryset(self):
+        feed.pull_celebrity_posts(self.request.user)
+        return self.expand_queryset(FeedEntry.objects.filter(
+            visible_q(Post, 'post__'),
+            user=self.request.user,
+            post__deleted_at__isnull=True,
+        ).select_related('post__author'), prefix='post__')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(
+            [entry.post for entry in page], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+
+class ExportView(APIView):
+    def get_queryset(self, model=Post, comments=Comment):
+        params = self.request.query_params
+        queryset = model.objects.visible().select_related('author').order_by(
+            'pub_date', 'pk'
+        )
+        if params.get('since'):
+            since = parse_datetime(params['since'])
+            if since is None:
+                raise ValidationError({'since': ['Неверный формат даты.']})
+            after = params.get('after', '0')
+            if not after.isdigit():
+                raise ValidationError({'after': ['Ожидается целое число.']})
+            queryset = queryset.filter(
+                Q(pub_date__gt=since) | Q(pub_date=since, pk__gt=int(after))
+            )
+        if params.get('comments'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'comments',
+                queryset=comments.objects.visible().select_related(
+                    'author'
+                ).order_by('post_id', 'created')
+            ))
+        return queryset
+
+    def get(self, request):
+        with_comments = bool(request.query_params.get('comments'))
+        # Архив старше горячей таблицы: сначала он, затем свежие посты.
+        querysets = [
+            self.get_queryset(ArchivedPost, ArchivedComment),
+            self.get_queryset(),
+        ]
+        renderer = FastJSONRenderer()
+
+        def lines():
+            for queryset in querysets:
+                posts = queryset.iterator(
+                    chunk_size=settings.EXPORT_CHUNK_SIZE
+                )
+                for post in posts:
+                    data = PostSerializer(post).data
+                    if with_comments:
+                        data['comments'] = CommentSerializer(
+                            post.comments.all(), many=True
+                        ).data
+                    yield renderer.render(data) + b'\n'
+
+        return StreamingHttpResponse(
+            lines(), content_type='application/x-ndjson'
+        )
+
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    serializers = {
+        'posts': (Post, ArchivedPost, PostSerializer),
+        'comments': (Comment, ArchivedComment, CommentSerializer),
+    }
+
+    def get(self, request):
+        params = request.query_params
+        kind = params.get('type', 'posts')
+        if kind not in self.serializers:
+            raise ValidationError({'type': ['Ожидается posts или comments.']})
+        group = params.get('group')
+        if group is not None and not group.isdigit():
+            raise ValidationError({'group': ['Ожидается ID группы.']})
+        limit = params.get('limit', '20')
+        if not limit.isdigit():
+            raise ValidationError({'limit': ['Ожидается целое число.']})
+        query = params.get('q', '')
+        if not search.match_terms(query):
+            raise ValidationError({'q': ['Ожидается хотя бы одно слово.']})
+
+        ids = search.search(
+            kind,
+            query,
+            group=group,
+            author=params.get('author'),
+            limit=min(max(int(limit), 1), settings.SEARCH_MAX_RESULTS),
+        )
+        model, archived, serializer_class = self.serializers[kind]
+        # Порядок задаёт релевантность, сортировка по дате не нужна.
+        found = model.objects.visible().select_related(
+            'author'
+        ).order_by().in_bulk(ids)
+        missing = set(ids) - set(found)
+        if missing:
+            found.update(archived.objects.visible().select_related(
+                'author'
+            ).order_by().in_bulk(missing))
+        serializer = serializer_class(
+            [found[pk] for pk in ids if pk in found], many=True
+        )
+        return Response({'results': serializer.data})
+
+
+class ChangesView(APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    serializers = {
+        'group': (Group.objects.all(), GroupSerializer),
+        'post': (Post.objects.visible().select_related('author'),
+                 PostSerializer),
+        'comment': (Comment.objects.visible().select_related('author'),
+                    CommentSerializer),
+        'follow': (Follow.objects.visible().select_related(
+            'user', 'following'
+        ), FollowSerializer),
+    }
+    archived = {
+        'post': ArchivedPost.objects.visible().select_related('author'),
+        'comment': ArchivedComment.objects.visible().select_related('author'),
+    }
+
+    def get(self, request):
+        params = request.query_params
+        since = params.get('since', '0')
+        if not since.isdigit():
+            raise ValidationError({'since': ['Ожидается токен из поля next.']})
+        limit = params.get('limit', str(settings.CHANGES_BATCH_SIZE))
+        if not limit.isdigit():
+            raise ValidationError({'limit': ['Ожидается целое число.']})
+        limit = min(max(int(limit), 1), settings.CHANGES_MAX_BATCH_SIZE)
+
+        queryset = Change.objects.filter(id__gt=since)
+        settle = settings.CHANGES_SETTLE_SECONDS
+        if settle:
+            # Запись из ещё не закоммиченной транзакции может появиться
+            # с меньшим номером позже: свежий хвост журнала не отдаём.
+            queryset = queryset.filter(
+                changed__lte=timezone.now() - timedelta(seconds=settle)
+            )
+        changes = list(queryset[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        data = {}
+        for kind, (objects, serializer_class) in self.serializers.items():
+            ids = [
+                change.object_id for change in changes
+                if change.kind == kind and not change.deleted
+            ]
+            if ids:
+                found = objects.order_by().in_bulk(ids)
+                missing = set(ids) - set(found)
+                if missing and kind in self.archived:
+                    found.update(
+                        self.archived[kind].order_by().in_bulk(missing)
+                    )
+                serialized = serializer_class(
+                    list(found.values()), many=True,
+                    context={'request': request},
+                ).data
+                data[kind] = dict(zip(found, serialized))
+
+        results = []
+        for change in changes:
+            item = data.get(change.kind, {}).get(change.object_id)
+            results.append({
+                'type': change.kind,
+                'id': change.object_id,
+                'deleted': item is None,
+                'data': item,
+            })
+        return Response({
+            'next': str(changes[-1].id) if changes else since,
+            'has_more': has_more,
+            'results': results,
+        })
+
+
+class TrendingView(APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    serializers = {
+        'posts': (Post.objects.visible().select_related('author'),
+                  PostSerializer),
+        'groups': (Group.objects.all(), GroupSerializer),
+    }
+
+    def get(self, request):
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit():
+            raise ValidationError({'limit': ['Ожидается целое число.']})
+        limit = min(max(int(limit), 1), settings.TRENDING['MAX_RESULTS'])
+        trending.schedule()
+
+        top = trending.top(limit, Post, Group)
+        data = {}
+        for key, (objects, serializer_class) in self.serializers.items():
+            scores = top[objects.model]
+            # Порядок задаёт вес, сортировка по дате не нужна.
+            found = objects.order_by().in_bulk([pk for pk, _ in scores])
+            scores = [(pk, score) for pk, score in scores if pk in found]
+            serialized = serializer_class(
+                [found[pk] for pk, _ in scores], many=True,
+                context={'request': request},
+            ).data
+            data[key] = [
+                {'score': round(score, 3), 'data': item}
+                for (_, score), item in zip(scores, serialized)
+            ]
+        return Response(data)
+
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    throttle_scope = 'token'
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    serializer_class = DenylistTokenRefreshSerializer
+    throttle_scope = 'token'
+
+
+class TokenRevokeView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_scope = 'token'
 
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_204_NO_CONTENT)
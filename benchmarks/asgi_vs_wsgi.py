@@ -0,0 +1,56 @@
+"""Сравнение синхронного (WSGI) и асинхронного (ASGI) пути чтения.
+
+Запустите оба сервера на одной базе, например:
+
+    gunicorn -w 1 --threads 8 -b 127.0.0.1:8000 yatube_api.wsgi
+    uvicorn --workers 1 --port 8001 yatube_api.asgi:application
+
+и затем:
+
+    python -m benchmarks.asgi_vs_wsgi --wsgi http://127.0.0.1:8000 \
+        --asgi http://127.0.0.1:8001 --concurrency 500 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+
+from .http import load
+
+ROUTES = (
+    ('posts', '/api/v1/posts/', '/api/v1/async/posts/'),
+    ('post', '/api/v1/posts/{post}/', '/api/v1/async/posts/{post}/'),
+    ('comments', '/api/v1/posts/{post}/comments/',
+     '/api/v1/async/posts/{post}/comments/'),
+    ('group', '/api/v1/group/', '/api/v1/async/group/'),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wsgi', default='http://127.0.0.1:8000')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8001')
+    parser.add_argument('--post', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    results = {}
+    for name, sync_path, async_path in ROUTES:
+        for server, base, path in (
+            ('wsgi', args.wsgi, sync_path), ('asgi', args.asgi, async_path)
+        ):
+            url = base + path.format(post=args.post)
+            results[f'{name}:{server}'] = asyncio.run(
+                load([url], args.requests, args.concurrency)
+            )
+
+    print(f'{"маршрут":<16}{"rps":>10}{"p50, мс":>10}{"p99, мс":>10}'
+          f'{"ошибки":>8}')
+    for key, result in results.items():
+        print(f'{key:<16}{result["rps"]:>10.1f}{result["p50_ms"]:>10.1f}'
+              f'{result["p99_ms"]:>10.1f}{result["errors"]:>8}')
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
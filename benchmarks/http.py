@@ -0,0 +1,69 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def fetch(url, headers=None, method='GET', body=b''):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or 80
+    )
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    lines = [
+        f'{method} {path} HTTP/1.0',
+        f'Host: {parts.netloc}',
+        'Connection: close',
+        f'Content-Length: {len(body)}',
+    ]
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b' ', 2)[1])
+    head, _, content = response.partition(b'\r\n\r\n')
+    return status, head, content
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary(latencies, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def load(urls, requests, concurrency, headers=None):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for number in range(requests):
+        queue.put_nowait(urls[number % len(urls)])
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            url = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                status, _, _ = await fetch(url, headers)
+            except OSError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summary(latencies, errors, time.perf_counter() - started)
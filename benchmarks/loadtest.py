@@ -0,0 +1,421 @@
+"""Нагрузочный прогон всех маршрутов API с проверкой на регрессии.
+
+Подготовка (один раз):
+
+    python manage.py migrate
+    python manage.py seed --size 10k
+
+Сервер без ограничений частоты:
+
+    API_THROTTLE=0 gunicorn -w 4 -b 127.0.0.1:8000 yatube_api.wsgi
+
+Прогон:
+
+    python -m benchmarks.loadtest --mix read --requests 20000
+    python -m benchmarks.loadtest --mix write --save
+
+Сначала каждый маршрут один раз вызывается в этом же процессе через
+тестовый клиент Django, чтобы посчитать SQL-запросы (с холодным кэшем
+ответов, в откатываемой транзакции). Затем сервер нагружается смесью
+запросов. Если для смеси есть сохранённый результат в benchmarks/baselines,
+прогон завершается с кодом 1 при падении rps, росте p99 или числа запросов.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import quote
+
+from .http import fetch, percentile
+
+BASELINES = Path(__file__).resolve().parent / 'baselines'
+WORDS = ('python', 'django', 'котики', 'погода', 'музыка', 'код')
+
+
+def text(size=40):
+    return ' '.join(random.choices(WORDS, k=size))
+
+
+def some_post(ctx):
+    return random.choice(ctx['posts'])
+
+
+def some_users(ctx, size=10):
+    names = [f'bench{n}' for n in random.sample(range(ctx['users']), size)]
+    return [name for name in names if name != ctx['username']]
+
+
+class Route:
+    def __init__(self, method, path, body=None, auth=True, ok=(200,)):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.auth = auth
+        self.ok = ok
+
+    def build(self, ctx):
+        path = self.path(ctx) if callable(self.path) else self.path
+        body = self.body(ctx) if self.body else None
+        return self.method, path, body
+
+
+ROUTES = {
+    'token': Route('POST', '/api/v1/token/', lambda c: {
+        'username': c['username'], 'password': c['password'],
+    }, auth=False),
+    'token:refresh': Route('POST', '/api/v1/token/refresh/', lambda c: {
+        'refresh': c['refresh'],
+    }, auth=False),
+    'token:revoke': Route('POST', '/api/v1/token/revoke/', lambda c: {
+        'refresh': c['revoked'],
+    }, auth=False, ok=(204,)),
+    'posts:list': Route('GET', '/api/v1/posts/'),
+    'posts:group': Route(
+        'GET', lambda c: f'/api/v1/posts/?group={random.choice(c["groups"])}'
+    ),
+    'posts:detail': Route('GET', lambda c: f'/api/v1/posts/{some_post(c)}/'),
+    'posts:create': Route('POST', '/api/v1/posts/', lambda c: {
+        'text': text(),
+    }, ok=(201,)),
+    'posts:update': Route(
+        'PATCH', lambda c: f'/api/v1/posts/{c["mine"]}/',
+        lambda c: {'text': text()},
+    ),
+    'posts:delete': Route(
+        'DELETE', lambda c: f'/api/v1/posts/{c["created"].pop()}/',
+        ok=(204,),
+    ),
+    'posts:bulk': Route('POST', '/api/v1/posts/bulk/', lambda c: [
+        {'text': text()} for _ in range(10)
+    ], ok=(201,)),
+    'comments:list': Route(
+        'GET', lambda c: f'/api/v1/posts/{some_post(c)}/comments/'
+    ),
+    'comments:create': Route(
+        'POST', lambda c: f'/api/v1/posts/{some_post(c)}/comments/',
+        lambda c: {'text': text(10)}, ok=(201,),
+    ),
+    'comments:detail': Route(
+        'GET', lambda c: '/api/v1/posts/{}/comments/{}/'.format(*c['comment'])
+    ),
+    'comments:bulk': Route(
+        'POST', lambda c: f'/api/v1/posts/{some_post(c)}/comments/bulk/',
+        lambda c: [{'text': text(10)} for _ in range(10)], ok=(201,),
+    ),
+    'follow:list': Route('GET', '/api/v1/follow/'),
+    'follow:search': Route(
+        'GET', lambda c: f'/api/v1/follow/?search={c["username"]}'
+    ),
+    'follow:create': Route('POST', '/api/v1/follow/', lambda c: {
+        'following': f'bench{random.randrange(c["users"])}',
+    }, ok=(201, 400)),
+    # id подписок API не отдаёт; seed создаёт их с id от 1.
+    'follow:detail': Route('GET', '/api/v1/follow/1/', ok=(200, 404)),
+    'follow:bulk': Route(
+        'POST', '/api/v1/follow/bulk/', some_users, ok=(201,)
+    ),
+    'follow:check': Route('GET', lambda c: (
+        f'/api/v1/follow/check/?username={",".join(some_users(c))}'
+    )),
+    'follow:mutual': Route('GET', '/api/v1/follow/mutual/'),
+    'follow:followers': Route('GET', '/api/v1/follow/followers/'),
+    'follow:following': Route('GET', '/api/v1/follow/following/'),
+    'group:list': Route('GET', '/api/v1/group/'),
+    'group:detail': Route(
+        'GET', lambda c: f'/api/v1/group/{random.choice(c["groups"])}/'
+    ),
+    'group:posts': Route(
+        'GET', lambda c: f'/api/v1/group/{random.choice(c["slugs"])}/posts/'
+    ),
+    'feed': Route('GET', '/api/v1/feed/'),
+    'search': Route(
+        'GET', lambda c: f'/api/v1/search/?q={quote(random.choice(WORDS))}'
+    ),
+    'export': Route(
+        'GET', lambda c: f'/api/v1/export/?since={quote(c["since"])}'
+    ),
+    'changes': Route('GET', '/api/v1/changes/'),
+    'trending': Route('GET', '/api/v1/trending/'),
+    'async:posts': Route('GET', '/api/v1/async/posts/'),
+    'async:detail': Route(
+        'GET', lambda c: f'/api/v1/async/posts/{some_post(c)}/'
+    ),
+    'async:group': Route('GET', '/api/v1/async/group/'),
+    'async:comments': Route(
+        'GET', lambda c: f'/api/v1/async/posts/{some_post(c)}/comments/'
+    ),
+}
+
+MIXES = {
+    'read': {
+        'posts:list': 25, 'posts:group': 5, 'group:posts': 5,
+        'posts:detail': 15,
+        'comments:list': 15, 'group:list': 5, 'follow:list': 3,
+        'follow:search': 2, 'feed': 10, 'search': 5, 'export': 1,
+        'trending': 2, 'async:posts': 5, 'async:comments': 2, 'token': 1,
+        'token:refresh': 1, 'posts:create': 2, 'comments:create': 2,
+        'follow:create': 1, 'changes': 1, 'comments:detail': 2,
+        'follow:detail': 1, 'follow:check': 1, 'follow:mutual': 1,
+        'follow:followers': 1, 'follow:following': 1, 'group:detail': 1,
+        'async:detail': 2, 'async:group': 1,
+    },
+    'write': {
+        'posts:list': 15, 'posts:detail': 10, 'comments:list': 10,
+        'feed': 10, 'posts:create': 15, 'posts:update': 5,
+        'posts:delete': 5, 'posts:bulk': 2, 'comments:create': 15,
+        'follow:create': 8, 'token': 2, 'token:refresh': 2,
+        'token:revoke': 1, 'comments:bulk': 2, 'follow:bulk': 1,
+    },
+}
+
+
+def results_of(data):
+    return data['results'] if isinstance(data, dict) else data
+
+
+def prepare(send, ctx, options):
+    """Токены и id, на которые ссылаются маршруты."""
+    ctx.update(
+        username=options.username, password=options.password,
+        users=options.users,
+    )
+    for key in ('revoked', 'refresh'):
+        status, data = send(*ROUTES['token'].build(ctx), auth=False)
+        if status != 200:
+            sys.exit(f'Не удалось получить токен: {status} {data}')
+        ctx[key], ctx['access'] = data['refresh'], data['access']
+    posts = results_of(send('GET', '/api/v1/posts/')[1])
+    ctx['posts'] = [post['id'] for post in posts]
+    ctx['since'] = posts[-1]['pub_date']
+    groups = results_of(send('GET', '/api/v1/group/')[1])
+    ctx['groups'] = [group['id'] for group in groups] or ['']
+    ctx['slugs'] = [group['slug'] for group in groups]
+    for post in posts:
+        if post['comment_count']:
+            comments = send('GET', f'/api/v1/posts/{post["id"]}/comments/')
+            ctx['comment'] = post['id'], results_of(comments[1])[0]['id']
+            break
+    ctx['created'] = [
+        post['id'] for post in send(*ROUTES['posts:bulk'].build(ctx))[1]
+    ]
+    ctx['mine'] = ctx['created'].pop()
+
+
+def count_queries(options):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube_api.settings')
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.core.cache import caches
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    client = APIClient(SERVER_NAME='localhost')
+    ctx = {}
+    # Число запросов у follow:create зависит от выбранного автора.
+    random.seed(0)
+
+    def send(method, path, body=None, auth=True):
+        headers = {}
+        if auth:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {ctx["access"]}'
+        response = client.generic(
+            method, path, json.dumps(body) if body is not None else '',
+            content_type='application/json', **headers
+        )
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        if response.get('Content-Type') == 'application/json':
+            content = json.loads(content)
+        return response.status_code, content
+
+    queries = {}
+    with transaction.atomic():
+        prepare(send, ctx, options)
+        for name, route in ROUTES.items():
+            caches[settings.API_CACHE_ALIAS].clear()
+            method, path, body = route.build(ctx)
+            with CaptureQueriesContext(connection) as context:
+                status, _ = send(method, path, body, auth=route.auth)
+            if status not in route.ok:
+                print(f'{name}: неожиданный статус {status}', file=sys.stderr)
+            queries[name] = len(context)
+        transaction.set_rollback(True)
+    return queries
+
+
+def http_sender(url, ctx):
+    base = url.rstrip('/')
+
+    async def send(method, path, body=None, auth=True):
+        headers = {'Content-Type': 'application/json'}
+        if auth:
+            headers['Authorization'] = f'Bearer {ctx["access"]}'
+        payload = json.dumps(body).encode() if body is not None else b''
+        status, _, content = await fetch(base + path, headers, method, payload)
+        try:
+            return status, json.loads(content)
+        except ValueError:
+            return status, content
+
+    return send
+
+
+async def run_load(options, ctx):
+    send = http_sender(options.url, ctx)
+    names, weights = zip(*MIXES[options.mix].items())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    remaining = options.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            name = random.choices(names, weights)[0]
+            if name == 'posts:delete' and not ctx['created']:
+                name = 'posts:create'
+            route = ROUTES[name]
+            method, path, body = route.build(ctx)
+            started = time.perf_counter()
+            try:
+                status, data = await send(method, path, body, route.auth)
+            except OSError:
+                errors[name] += 1
+                continue
+            latencies[name].append(time.perf_counter() - started)
+            if status not in route.ok:
+                errors[name] += 1
+            elif name == 'posts:create':
+                ctx['created'].append(data['id'])
+            elif name == 'posts:bulk':
+                ctx['created'].extend(post['id'] for post in data)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(options.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        'mix': options.mix,
+        'concurrency': options.concurrency,
+        'requests': total,
+        'rps': total / elapsed,
+        'errors': sum(errors.values()),
+        'routes': {
+            name: {
+                'requests': len(values),
+                'errors': errors[name],
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+            }
+            for name, values in sorted(latencies.items())
+        },
+    }
+
+
+def regressions(result, baseline, tolerance, noise_ms):
+    """Время сравнивается, только если базовый прогон его содержит.
+
+    Число SQL-запросов от железа не зависит, поэтому в репозитории хранятся
+    только они; времена записываются через --save на эталонной машине.
+    """
+    found = []
+    if 'rps' in baseline and result['rps'] < baseline['rps'] * (1 - tolerance):
+        found.append(f'rps: {result["rps"]:.1f} < {baseline["rps"]:.1f}')
+    for name, route in result['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if before is None:
+            continue
+        limit = max(before['p99_ms'] * (1 + tolerance),
+                    before['p99_ms'] + noise_ms)
+        if route['p99_ms'] > limit:
+            found.append(
+                f'{name}: p99 {route["p99_ms"]:.1f} мс > {limit:.1f} мс'
+            )
+    for name, count in result['queries'].items():
+        before = baseline['queries'].get(name)
+        if before is not None and count > before:
+            found.append(f'{name}: {count} SQL-запросов вместо {before}')
+    return found
+
+
+def report(result):
+    print(f'{result["mix"]}: {result["requests"]} запросов, '
+          f'{result["rps"]:.1f} rps, ошибок {result["errors"]}')
+    print(f'{"маршрут":<18}{"n":>7}{"p50":>9}{"p95":>9}{"p99":>9}'
+          f'{"sql":>6}{"ошибки":>8}')
+    for name in ROUTES:
+        route = result['routes'].get(name, {})
+        print(
+            f'{name:<18}{route.get("requests", 0):>7}'
+            f'{route.get("p50_ms", 0):>9.1f}{route.get("p95_ms", 0):>9.1f}'
+            f'{route.get("p99_ms", 0):>9.1f}'
+            f'{result["queries"].get(name, "-"):>6}'
+            f'{route.get("errors", 0):>8}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--mix', choices=MIXES, default='read')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--username', default='bench0')
+    parser.add_argument('--password', default='bench')
+    parser.add_argument(
+        '--users', type=int, default=500,
+        help='Сколько пользователей bench<N> создал seed'
+    )
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument(
+        '--save', action='store_true',
+        help='Записать результат как новый базовый'
+    )
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--noise-ms', type=float, default=5.0)
+    parser.add_argument('--output', type=Path)
+    options = parser.parse_args()
+
+    queries = count_queries(options)
+    ctx = {}
+    send = http_sender(options.url, ctx)
+    prepare(
+        lambda *args, **kwargs: asyncio.run(send(*args, **kwargs)),
+        ctx, options,
+    )
+    result = asyncio.run(run_load(options, ctx))
+    result['queries'] = queries
+    report(result)
+
+    if options.output:
+        options.output.write_text(json.dumps(result, indent=2))
+    baseline = options.baseline or BASELINES / f'{options.mix}.json'
+    if options.save:
+        baseline.parent.mkdir(exist_ok=True)
+        baseline.write_text(json.dumps(result, indent=2) + '\n')
+        print(f'Базовый результат записан в {baseline}')
+    elif baseline.exists():
+        found = regressions(
+            result, json.loads(baseline.read_text()),
+            options.tolerance, options.noise_ms,
+        )
+        for line in found:
+            print(f'РЕГРЕССИЯ {line}', file=sys.stderr)
+        if found or result['errors']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
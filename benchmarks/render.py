@@ -0,0 +1,86 @@
+"""Время рендеринга и размер типичной страницы /posts/.
+
+    python -m benchmarks.render --posts 20 --words 200
+
+Сравнивает JSONRenderer из DRF с FastJSONRenderer и сжатие страницы
+gzip и brotli с настройками из COMPRESSION.
+"""
+import argparse
+import os
+import random
+import timeit
+
+
+def page(posts, words):
+    vocabulary = (
+        'python django пост группа подписка лента новости котики погода '
+        'город книга музыка кино спорт путешествие работа код'
+    ).split()
+    return {
+        'next': 'http://127.0.0.1:8000/api/v1/posts/?cursor=cD0yMDI2',
+        'previous': None,
+        'results': [
+            {
+                'id': number,
+                'text': ' '.join(random.choices(vocabulary, k=words)),
+                'author': f'bench{number % 50}',
+                'pub_date': '2026-10-18T19:59:00.123456Z',
+                'comment_count': number % 7,
+                'image': None,
+                'renditions': {},
+            }
+            for number in range(posts)
+        ],
+    }
+
+
+def measure(function, repeat):
+    return min(timeit.repeat(function, number=repeat, repeat=5)) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200)
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube_api.settings')
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from rest_framework.renderers import JSONRenderer
+
+    from api import renderers
+    from api.compression import Brotli, Gzip, brotli
+
+    data = page(options.posts, options.words)
+    print(f'Страница: {options.posts} постов по {options.words} слов')
+
+    body = None
+    for name, renderer in (
+        ('drf json', JSONRenderer()),
+        ('fast json' if renderers.orjson else 'fast json (нет orjson)',
+         renderers.FastJSONRenderer()),
+    ):
+        body = renderer.render(data)
+        seconds = measure(lambda: renderer.render(data), options.repeat)
+        print(f'{name:<24}{seconds * 1e6:>10.1f} мкс{len(body):>10} байт')
+
+    codecs = [Gzip] + ([Brotli] if brotli is not None else [])
+    for codec in codecs:
+        def compress():
+            compressor = codec(settings.COMPRESSION)
+            return compressor.compress(body) + compressor.finish()
+
+        size = len(compress())
+        seconds = measure(compress, options.repeat)
+        print(
+            f'{codec.name:<24}{seconds * 1e6:>10.1f} мкс{size:>10} байт'
+            f'{size / len(body):>8.1%}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -18,11 +18,14 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'api',
+    'api.apps.ApiConfig',
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.compression.CompressionMiddleware',
+    'api.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,13 +55,89 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube_api.wsgi.application'
 
-DATABASES = {
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'yatube'),
+            'USER': os.environ.get('POSTGRES_USER', 'yatube'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DB_POOL_MAX_SIZE'):
+        # Пул psycopg 3 вместо постоянных соединений: Django не позволяет
+        # включить оба сразу.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+                'timeout': 10,
+            },
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'OPTIONS': {
+                # Ждать блокировку вместо «database is locked», а транзакции
+                # на запись начинать сразу с BEGIN IMMEDIATE, чтобы два
+                # писателя не упирались друг в друга при повышении блокировки.
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+                # WAL: читатели не ждут писателя.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA cache_size=-65536;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+# Реплики только для чтения через запятую: пути к файлам для SQLite или
+# хосты для Postgres. Для локальной проверки достаточно копии базы:
+# cp db.sqlite3 replica.sqlite3 && DB_REPLICAS=replica.sqlite3
+for number, replica in enumerate(
+    filter(None, os.environ.get('DB_REPLICAS', '').split(','))
+):
+    location = 'HOST' if DB_ENGINE == 'postgresql' else 'NAME'
+    DATABASES[f'replica{number}'] = dict(
+        DATABASES['default'], **{location: replica},
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+
+# Версии тегов ответов и пользователей (api.cache) должны быть общими для
+# всех процессов: LocMemCache годится только для разработки с одним
+# процессом, manage.py check --deploy сообщит о нём ошибкой api.E001.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'yatube'),
     }
 }
 
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -88,26 +167,66 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static/'),)
 
+MEDIA_URL = '/media/'
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+IMAGE_RENDITIONS = {
+    'WIDTHS': (320, 640, 1280),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 82,
+    'WORKERS': 2,
+}
+
 REST_FRAMEWORK = {        
+    # orjson необязателен: без него FastJSONRenderer работает как JSONRenderer.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    # API_THROTTLE=0 отключает ограничения, например для нагрузочных тестов.
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
-    ],
+        'api.throttling.UserSlidingThrottle',
+        'api.throttling.AnonSlidingThrottle',
+        'api.throttling.ScopedSlidingThrottle',
+        'api.throttling.WriteSlidingThrottle',
+    ] if os.environ.get('API_THROTTLE', '1') != '0' else [],
     'DEFAULT_THROTTLE_RATES': {
         'user': '10000/day',
         'anon': '1000/day',
+        'posts': '600/minute',
+        'token': '20/minute',
+        'write': '120/minute',
     }
 }
 
+THROTTLE_STORE = {
+    'BACKEND': os.environ.get('THROTTLE_BACKEND', 'sqlite'),
+    'LOCATION': os.environ.get(
+        'THROTTLE_LOCATION', os.path.join(BASE_DIR, 'throttle.sqlite3')
+    ),
+    'ALIAS': os.environ.get('THROTTLE_CACHE_ALIAS', 'default'),
+}
+
+# Тесты держат счётчики ограничений в кэше, а не в THROTTLE_STORE.
+TEST_RUNNER = 'api.test_runner.TestRunner'
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=2),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -115,5 +234,88 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+BULK_MAX_ITEMS = 1000
+
+EXPORT_CHUNK_SIZE = 500
+
+SEARCH_MAX_RESULTS = 100
+
+CHANGES_BATCH_SIZE = 500
+CHANGES_MAX_BATCH_SIZE = 2000
+# На Postgres транзакции коммитятся не в порядке номеров журнала: задержка
+# должна быть больше самой долгой пишущей транзакции. SQLite пишет
+# последовательно, ей задержка не нужна.
+CHANGES_SETTLE_SECONDS = 0
+
+# Удалённые посты, группы и пользователи скрываются сразу, а строки
+# удаляет фоновый поток: пачками по BATCH_SIZE с паузой PAUSE секунд.
+PURGE = {
+    'BACKGROUND': True,
+    'BATCH_SIZE': 200,
+    'PAUSE': 0.2,
+}
+
+# Посты старше DAYS дней вместе с комментариями переносятся в архивные
+# таблицы: пачками по BATCH_SIZE постов с паузой PAUSE секунд, не чаще раза
+# в INTERVAL секунд после новых постов. Архив только читается: новые
+# комментарии к таким постам не принимаются.
+ARCHIVE = {
+    'DAYS': 365,
+    'BACKGROUND': True,
+    'INTERVAL': 3600,
+    'BATCH_SIZE': 100,
+    'PAUSE': 0.2,
+}
+
+# id последних SIZE постов для GROUPS групп в памяти процесса: первая
+# страница /group/{slug}/posts/ не обходит индекс.
+GROUP_RECENT_POSTS = {
+    'SIZE': 200,
+    'GROUPS': 1000,
+}
+
+# Тренды: вес поста — затухающая сумма его комментариев, вес группы —
+# комментариев и новых постов (с множителем POST_WEIGHT). Вес события
+# вдвое меньше каждые HALF_LIFE секунд, строки легче MIN_SCORE удаляются.
+# Фоновый поток учитывает новые строки не чаще раза в INTERVAL секунд.
+TRENDING = {
+    'HALF_LIFE': 6 * 3600,
+    'POST_WEIGHT': 1.0,
+    'MIN_SCORE': 0.01,
+    'MAX_RESULTS': 100,
+    'BACKGROUND': True,
+    'INTERVAL': 60,
+    'BATCH_SIZE': 1000,
+    'PAUSE': 0.2,
+}
+
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL = 100
+# Сколько страниц пропущенных постов знаменитостей дочитывает один запрос.
+FEED_PULL_PAGES = 5
+
+METRICS = {
+    # Доля запросов под профайлером; сохраняются только медленнее порога.
+    'PROFILE_SAMPLE_RATE': float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    'PROFILE_THRESHOLD': float(os.environ.get('PROFILE_THRESHOLD', 0.5)),
+    # 'prof' для pstats/snakeviz или 'folded' для flamegraph.pl/speedscope.
+    'PROFILE_FORMAT': os.environ.get('PROFILE_FORMAT', 'prof'),
+    'PROFILE_INTERVAL': 0.005,
+    'PROFILE_DIR': os.path.join(BASE_DIR, 'profiles'),
+}
+
+# brotli необязателен: без него ответы сжимаются только gzip.
+COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'FLUSH_SIZE': 64 * 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+AUTH_CACHE = {
+    'SIZE': 10000,
+    'TTL': 300,
+}
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'